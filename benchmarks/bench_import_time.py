@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+# Import-time budget check.
+#
+# Runs each scenario in a fresh interpreter with -X importtime and reports the time
+# spent importing modules beyond those the bare interpreter loads (site, etc.).
+# A scenario fails if it exceeds its budget or imports a module it should not:
+#   cli        -- run_command.py --help
+#   cli-daemon -- run_command.py ls attached to a hub daemon (a HubBroker serving the hub
+#                 emulator, started by this script), which must not load the hub client stack
+#   hubclient  -- importing HubClient and HubMonitor, which must defer configuration
+#                 loading (cfg_load) and hardware modules to first use
+#
+# Exits with status 1 if any scenario fails, so it can be used in CI.
+#
+# Usage: python3 benchmarks/bench_import_time.py [--repeat N] [--scale FACTOR]
+
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+HARDWARE_MODULES = ['serial', 'bluetooth', 'pyudev']
+
+CLI_FORBIDDEN = ['cfg_load', 'tqdm', 'mpy_cross', 'comm.HubClient', 'comm.Reactor', 'data.HubMonitor'] + HARDWARE_MODULES
+
+SCENARIOS = [
+    # (name, interpreter arguments, budget in ms, forbidden modules); {socket} is the daemon socket
+    ('cli', ['run_command.py', '--help'], 50, CLI_FORBIDDEN),
+    ('cli-daemon', ['run_command.py', '--socket', '{socket}', 'ls'], 50, CLI_FORBIDDEN),
+    ('hubclient', ['-c', 'import comm.HubClient, data.HubMonitor'], 80,
+        ['cfg_load'] + HARDWARE_MODULES),
+]
+
+
+def start_daemon(socket_path):
+    """Serve the hub emulator through a HubBroker in this process, as hub_daemon.py would."""
+    from comm.DirectConnectionMonitor import DirectConnectionMonitor
+    from comm.HubBroker import HubBroker
+    from comm.HubClient import HubClient
+    from comm.SerialConnection import SerialConnection
+    from data.HubMonitor import HubMonitor
+    from utils.HubEmulator import HubEmulator
+    emulator = HubEmulator()
+    emulator.start()
+    client = HubClient(DirectConnectionMonitor(SerialConnection(emulator.device_name)))
+    monitor = HubMonitor(client)
+    client.start()
+    if not client.wait_for_telemetry(10):
+        raise RuntimeError('hub emulator did not connect')
+    broker = HubBroker(client, monitor, socket_path)
+    broker.start()
+    return (emulator, broker)
+
+def import_times(args):
+    """Map of module name -> self import time (us) for a fresh interpreter run."""
+    result = subprocess.run([sys.executable, '-X', 'importtime'] + args, cwd=ROOT,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    if result.returncode != 0:
+        raise RuntimeError('%s failed: %s' % (' '.join(args), result.stderr.splitlines()[-1:]))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:'): continue
+        fields = line[len('import time:'):].split('|')
+        if not fields[0].strip().isdigit(): continue # header
+        times[fields[2].strip()] = int(fields[0])
+    return times
+
+def measure(args, baseline, repeat):
+    """Best-of-repeat import time (ms) of modules not in baseline, and the modules imported."""
+    best = None
+    for _ in range(repeat):
+        times = import_times(args)
+        total = sum(us for (name, us) in times.items() if name not in baseline) / 1000
+        best = total if best is None else min(best, total)
+    return (best, set(times))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check module import time against budgets')
+    parser.add_argument('--repeat', type=int, default=5, help='runs per scenario; the fastest counts')
+    parser.add_argument('--scale', type=float, default=1.0, help='multiply budgets, e.g. for slow machines')
+    args = parser.parse_args()
+
+    socket_dir = tempfile.mkdtemp()
+    socket_path = os.path.join(socket_dir, 'hub.sock')
+    (emulator, broker) = start_daemon(socket_path)
+
+    baseline = set(import_times(['-c', 'pass']))
+    failed = False
+    print("%-10s %10s %10s  %s" % ("Scenario", "Time (ms)", "Budget", "Result"))
+    try:
+        for (name, scenario_args, budget, forbidden) in SCENARIOS:
+            scenario_args = [arg.format(socket=socket_path) for arg in scenario_args]
+            (elapsed, modules) = measure(scenario_args, baseline, args.repeat)
+            budget *= args.scale
+            problems = ['imports %s' % module for module in forbidden if module in modules]
+            if elapsed > budget:
+                problems.append('over budget')
+            failed = failed or bool(problems)
+            print("%-10s %10.1f %10.1f  %s" % (name, elapsed, budget, ', '.join(problems) or 'ok'))
+    finally:
+        broker.stop()
+        emulator.stop()
+        os.rmdir(socket_dir)
+    sys.exit(1 if failed else 0)
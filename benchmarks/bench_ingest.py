@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+
+# End-to-end telemetry ingest benchmark.
+#
+# Drives the receive path -- line framing, HubClient._on_line_received, HubMonitor,
+# HubStatus and a CSV HubLogger -- from synthetic traffic or a capture file (see
+# comm.Capture), without a hub.  Reports:
+#   * sustained throughput (lines/sec) of the whole path
+#   * CPU time per line for each stage, measured by adding one stage at a time
+#     with synchronous dispatch and taking differences
+#   * p50/p99 latency from bytes read to HubStatus updated, using the configured
+#     dispatch queue (optionally paced at --rate lines/sec)
+#
+# Results are printed and, with --output, written as JSON for tracking between releases.
+#
+# Usage: python3 benchmarks/bench_ingest.py [--capture FILE] [--lines N] [--output results.json]
+
+import argparse
+from collections import deque
+import datetime
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comm.Capture import RECEIVED, read_capture
+from comm.Connection import Connection
+from comm.DirectConnectionMonitor import DirectConnectionMonitor
+from comm.HubClient import ConnectionState, HubClient
+from comm.LineFramer import LineFramer
+from data.BasicHubLogger import BasicHubLogger
+from data.HubMonitor import HubMonitor
+
+STAGES = ['framing', 'client', 'monitor', 'logger']
+
+# Telemetry lines from the hub start with the message type; responses start with the id
+TELEMETRY_PREFIX = '{"m"'
+
+
+class BenchConnection(Connection):
+    """Connection fed from memory, framing chunks as the serial/Bluetooth read loops do."""
+
+    def __init__(self):
+        super().__init__()
+        self._framer = LineFramer()
+        self.read_times = None
+        """If set, a deque receiving the read time (ns) of each telemetry line."""
+
+    @property
+    def name(self): return 'benchmark'
+
+    def open(self): pass
+
+    def close(self): pass
+
+    def write(self, line): pass
+
+    def feed(self, chunk):
+        read_time = time.perf_counter_ns()
+        for line in self._framer.feed(chunk):
+            if self.read_times is not None and line.startswith(TELEMETRY_PREFIX):
+                self.read_times.append(read_time)
+            self.events.line_received(line)
+
+
+def synthetic_lines(count):
+    lines = []
+    for i in range(count):
+        if i % 10 == 9:
+            lines.append(json.dumps({'m': 2, 'p': [8.3, 100, True]}, separators=(',', ':')))
+            continue
+        ports = [[75, [random.randint(-100, 100), random.randint(0, 359), random.randint(-180, 180), 0]]] * 2 + \
+                [[61, [None, 0, None, None, None]], [62, [random.randint(0, 200)]], [0, []], [0, []]]
+        status = ports + [[random.randint(-1000, 1000) for _ in range(3)] for _ in range(3)] + ['', 0]
+        lines.append(json.dumps({'m': 0, 'p': status}, separators=(',', ':')))
+    return lines
+
+def capture_lines(filename):
+    return [line for (ns, direction, line) in read_capture(filename) if direction == RECEIVED]
+
+def make_chunks(lines, chunk_size):
+    stream = ('\r'.join(lines) + '\r').encode('utf-8')
+    return [stream[i:i+chunk_size] for i in range(0, len(stream), chunk_size)]
+
+
+def build_pipeline(depth, queue_size, logfile):
+    """Connect the stages up to and including STAGES[depth]."""
+    conn = BenchConnection()
+    if depth < 1:
+        return (conn, None)
+
+    client = HubClient(DirectConnectionMonitor(conn), dispatch_queue_size=queue_size)
+    client.start()
+    while client.connection is not conn:
+        time.sleep(0.001)
+    conn.feed(b'{"m":2,"p":[8.3,100,true]}\r') # CONNECTING --> TELEMETRY
+    assert client.state == ConnectionState.TELEMETRY
+
+    if depth >= 2:
+        monitor = HubMonitor(client)
+        if depth >= 3:
+            monitor.logger = BasicHubLogger()
+            monitor.logger.start(logfile)
+    return (conn, client)
+
+def measure_stage_cpu(chunks, line_count, logfile):
+    """CPU ns/line of each stage, with synchronous dispatch."""
+    cumulative = []
+    for depth in range(len(STAGES)):
+        (conn, client) = build_pipeline(depth, 0, logfile)
+        start = time.process_time_ns()
+        for chunk in chunks:
+            conn.feed(chunk)
+        cumulative.append((time.process_time_ns() - start) / line_count)
+    return {STAGES[i]: cumulative[i] - (cumulative[i-1] if i > 0 else 0) for i in range(len(STAGES))}
+
+def measure_latency(chunks, line_count, queue_size, rate, logfile):
+    """Throughput and read-to-status-updated latency of the full pipeline."""
+    (conn, client) = build_pipeline(len(STAGES) - 1, queue_size, logfile)
+    conn.read_times = deque()
+    latencies = []
+    done = []
+
+    def on_status_updated(timestamp, message):
+        # Subscribed after HubMonitor, so called once the status has been updated
+        latencies.append(time.perf_counter_ns() - conn.read_times.popleft())
+        if len(latencies) == telemetry_count:
+            done.append(time.perf_counter_ns())
+
+    client.events.telemetry_update += on_status_updated
+    # Framed as the connection will frame them, since lines may span chunks
+    telemetry_count = sum(1 for line in LineFramer().feed(b''.join(chunks)) if line.startswith(TELEMETRY_PREFIX))
+
+    interval_ns = int(1e9 * len(chunks) / line_count / rate) if rate else 0
+    start = time.perf_counter_ns()
+    next_read = start
+    for chunk in chunks:
+        if interval_ns:
+            next_read += interval_ns
+            while time.perf_counter_ns() < next_read: pass
+        conn.feed(chunk)
+    while not done:
+        time.sleep(0.001)
+    elapsed = (done[0] - start) / 1e9
+
+    latencies.sort()
+    percentile = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] / 1000
+    return {
+        'throughput_lines_per_sec': line_count / elapsed,
+        'latency_us': {'p50': percentile(0.50), 'p99': percentile(0.99), 'max': latencies[-1] / 1000},
+        'dispatch': client.dispatcher.counters(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='End-to-end telemetry ingest benchmark')
+    parser.add_argument('--capture', help='capture file to replay (default: synthetic traffic)')
+    parser.add_argument('--lines', type=int, default=20000, help='number of synthetic lines')
+    parser.add_argument('--chunk-size', type=int, default=256, help='bytes per simulated read')
+    parser.add_argument('--queue-size', type=int, default=256, help='dispatch queue size for the latency run (0 = synchronous)')
+    parser.add_argument('--rate', type=float, default=0, help='pace the latency run at this many lines/sec (0 = unpaced)')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    random.seed(1)
+    lines = capture_lines(args.capture) if args.capture else synthetic_lines(args.lines)
+    chunks = make_chunks(lines, args.chunk_size)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        logfile = os.path.join(tmpdir, 'bench.csv')
+        stage_cpu = measure_stage_cpu(chunks, len(lines), logfile)
+        results = measure_latency(chunks, len(lines), args.queue_size, args.rate, logfile)
+
+    results.update({
+        'timestamp': datetime.datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'source': args.capture or 'synthetic',
+        'lines': len(lines),
+        'chunk_size': args.chunk_size,
+        'queue_size': args.queue_size,
+        'rate': args.rate,
+        'stage_cpu_ns_per_line': stage_cpu,
+    })
+
+    print("Lines: %d (%s), chunk size %d" % (len(lines), results['source'], args.chunk_size))
+    print("Throughput: %.0f lines/sec" % results['throughput_lines_per_sec'])
+    for stage in STAGES:
+        print("  %-8s %8.0f ns/line CPU" % (stage, stage_cpu[stage]))
+    latency = results['latency_us']
+    print("Latency read->status: p50 %.1f us, p99 %.1f us, max %.1f us" % (latency['p50'], latency['p99'], latency['max']))
+    print("Dispatch: %s" % results['dispatch'])
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
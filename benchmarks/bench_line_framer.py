@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+# Micro-benchmark: lines/sec of the connection line framer for various read chunk sizes.
+#
+# Compares LineFramer against the original read-loop framing (concatenate the chunk,
+# then extract at most one line per read).
+#
+# Usage: python3 benchmarks/bench_line_framer.py [--lines N]
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comm.LineFramer import LineFramer
+
+SAMPLE_LINES = [
+    b'{"m":0,"p":[[75,[0,0,0,0]],[75,[0,-12,0,0]],[61,[null,0,null,null,null]],[62,[null]],[0,[]],[0,[]],[-3,2,1007],[0,0,0],[-2,4,1],"",0]}',
+    b'{"m":2,"p":[8.316,100,true]}',
+    b'{"m":4,"p":"tapped"}',
+    b'{"m":"userProgram.print","p":{"value":"SGVsbG8gV29ybGQK"},"i":"aB3x"}',
+]
+
+
+def make_stream(line_count):
+    lines = [SAMPLE_LINES[i % len(SAMPLE_LINES)] for i in range(line_count)]
+    return b'\r'.join(lines) + b'\r'
+
+def chunks(stream, chunk_size):
+    return [stream[i:i+chunk_size] for i in range(0, len(stream), chunk_size)]
+
+def frame_original(pieces):
+    """Framing as done by the original SerialConnection/BluetoothConnection loops.
+
+    Lines left in the buffer after the last read are drained by subsequent empty reads,
+    as would happen when the next (idle) read returns.
+    """
+    count = 0
+    buffer = bytearray()
+    for chunk in pieces:
+        buffer = buffer + chunk
+        pos = buffer.find(13)
+        if pos >= 0:
+            buffer[:pos].decode('utf-8')
+            buffer = buffer[pos+1:]
+            count += 1
+    pos = buffer.find(13)
+    while pos >= 0:
+        buffer[:pos].decode('utf-8')
+        buffer = buffer[pos+1:]
+        count += 1
+        pos = buffer.find(13)
+    return count
+
+def frame_framer(pieces):
+    count = 0
+    framer = LineFramer()
+    for chunk in pieces:
+        count += len(framer.feed(chunk))
+    return count
+
+def measure(fn, pieces, expected):
+    start = time.perf_counter()
+    count = fn(pieces)
+    elapsed = time.perf_counter() - start
+    if count != expected:
+        raise RuntimeError('%s framed %d lines, expected %d' % (fn.__name__, count, expected))
+    return count / elapsed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark line framing throughput')
+    parser.add_argument('--lines', type=int, default=20000, help='number of lines in the synthetic stream')
+    args = parser.parse_args()
+
+    stream = make_stream(args.lines)
+    print("%10s %16s %16s %8s" % ("Chunk", "Original (l/s)", "LineFramer (l/s)", "Speedup"))
+    for chunk_size in [1, 16, 64, 256, 1024, 4096]:
+        pieces = chunks(stream, chunk_size)
+        original = measure(frame_original, pieces, args.lines)
+        framer = measure(frame_framer, pieces, args.lines)
+        print("%10d %16.0f %16.0f %7.1fx" % (chunk_size, original, framer, framer / original))
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+# Benchmark: CPU cost of the serial read strategies.
+#
+# A child process writes telemetry lines to a pseudo-terminal at a fixed rate; the
+# benchmark process reads them with each strategy and reports its CPU time:
+#   original  -- the former loop: in_waiting, then read(count or 1)
+#   blocking  -- SerialConnection reader thread, read_latency 0
+#   coalesced -- SerialConnection reader thread, read_latency 2 ms
+#   reactor   -- SerialConnection on the shared I/O reactor
+#
+# Usage: python3 benchmarks/bench_serial_read.py [--rate LINES_PER_SEC] [--duration SECONDS]
+
+import argparse
+import multiprocessing
+import os
+import pty
+import sys
+import threading
+import time
+import tty
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serial
+
+import comm.Reactor
+from comm.LineFramer import LineFramer
+from comm.SerialConnection import SerialConnection
+
+LINE = b'{"m":0,"p":[[75,[0,0,0,0]],[75,[0,-12,0,0]],[61,[null,0,null,null,null]],[62,[null]],[0,[]],[0,[]],[-3,2,1007],[0,0,0],[-2,4,1],"",0]}\r'
+
+
+def writer(master, rate, duration, burst):
+    """Write lines in bursts of `burst` lines, at `rate` lines/sec overall."""
+    period = burst / rate
+    deadline = time.monotonic() + duration
+    next_write = time.monotonic()
+    while next_write < deadline:
+        os.write(master, LINE * burst)
+        next_write += period
+        delay = next_write - time.monotonic()
+        if delay > 0: time.sleep(delay)
+
+
+def read_original(device, stop, counter):
+    ser = serial.Serial(device)
+    framer = LineFramer()
+    try:
+        while not stop.is_set():
+            count = ser.in_waiting
+            counter[0] += len(framer.feed(ser.read(count if count else 1)))
+    except (serial.SerialException, OSError):
+        pass # pty closed at end of run
+    ser.close()
+
+def run(strategy, rate, duration, burst):
+    (master, slave) = pty.openpty()
+    tty.setraw(slave)
+    device = os.ttyname(slave)
+    counter = [0]
+    stop = threading.Event()
+
+    if strategy == 'original':
+        reader = threading.Thread(target=read_original, args=(device, stop, counter))
+        reader.daemon = True
+        reader.start()
+    else:
+        comm.Reactor.enabled = strategy == 'reactor'
+        conn = SerialConnection(device, read_latency=0.002 if strategy == 'coalesced' else 0.0)
+        def on_line(line): counter[0] += 1
+        conn.events.line_received += on_line
+        conn.open()
+
+    time.sleep(0.1)
+    child = multiprocessing.Process(target=writer, args=(master, rate, duration, burst))
+    cpu_start = time.process_time()
+    child.start()
+    child.join()
+    time.sleep(0.1)
+    cpu = time.process_time() - cpu_start
+
+    if strategy == 'original':
+        stop.set()
+        os.write(master, b'\r') # unblock the reader
+    else:
+        conn.close()
+    os.close(master)
+    os.close(slave)
+    return (cpu, counter[0])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare CPU usage of serial read strategies')
+    parser.add_argument('--rate', type=float, default=500, help='lines per second written')
+    parser.add_argument('--burst', type=int, default=2, help='lines per write')
+    parser.add_argument('--duration', type=float, default=3, help='seconds per strategy')
+    args = parser.parse_args()
+
+    expected = int(args.rate * args.duration)
+    print("%-10s %10s %10s %12s" % ("Strategy", "CPU (s)", "CPU (%)", "Lines"))
+    for strategy in ['original', 'blocking', 'coalesced', 'reactor']:
+        (cpu, lines) = run(strategy, args.rate, args.duration, args.burst)
+        print("%-10s %10.3f %10.1f %12d" % (strategy, cpu, 100 * cpu / args.duration, lines))
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+
+# Benchmark: decode cost per telemetry frame.
+#
+# Compares the original HubClient decode path (find '{' then json.loads) against
+# TelemetryDecoder with each available backend.  The corpus is either a text file with
+# one received line per line, or a synthetic corpus dominated by m:0/m:2 frames.
+#
+# Usage: python3 benchmarks/bench_telemetry_decode.py [--corpus FILE] [--repeat N]
+
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from comm.TelemetryDecoder import TelemetryDecoder, orjson
+
+SYNTHETIC_CORPUS = (
+    ['{"m":0,"p":[[75,[0,0,0,0]],[75,[0,-12,0,0]],[61,[null,0,null,null,null]],[62,[null]],[0,[]],[0,[]],[-3,2,1007],[0,0,0],[-2,4,1],"",0]}'] * 20 +
+    ['{"m":2,"p":[8.316,100,true]}'] * 4 +
+    ['{"m":4,"p":"tapped"}',
+     '{"m":12,"p":["zBAZ4zVlAjuemfPMBTr3",true]}',
+     '{"m":"userProgram.print","p":{"value":"SGVsbG8gV29ybGQK"},"i":"aB3x"}',
+     '{"i":"aB3x","r":null}']
+)
+
+
+def decode_original(line):
+    begin = line.find('{')
+    if begin >= 0:
+        return json.loads(line[begin:])
+
+def load_corpus(filename):
+    with open(filename) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def measure(decode, corpus, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for line in corpus:
+            decode(line)
+    elapsed = time.perf_counter() - start
+    return elapsed / (repeat * len(corpus))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark telemetry decode cost per frame')
+    parser.add_argument('--corpus', help='file of recorded lines, one per line')
+    parser.add_argument('--repeat', type=int, default=2000, help='passes over the corpus')
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus) if args.corpus else SYNTHETIC_CORPUS
+
+    decoders = [('original json.loads', decode_original),
+                ('TelemetryDecoder (scanner)', TelemetryDecoder(use_orjson=False).decode)]
+    if orjson is not None:
+        decoders.append(('TelemetryDecoder (orjson)', TelemetryDecoder().decode))
+
+    for (name, decode) in decoders:
+        for line in corpus:
+            if decode(line) != decode_original(line):
+                raise RuntimeError('%s decodes differently: %s' % (name, line))
+
+    baseline = None
+    print("%-28s %12s %8s" % ("Decoder", "ns/frame", "Speedup"))
+    for (name, decode) in decoders:
+        cost = measure(decode, corpus, args.repeat)
+        baseline = baseline or cost
+        print("%-28s %12.0f %7.2fx" % (name, cost * 1e9, baseline / cost))
@@ -0,0 +1,145 @@
+from abc import ABC, abstractmethod
+import asyncio
+import logging
+import os
+import socket
+
+from comm.LineFramer import LineFramer
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+
+
+class AsyncConnection(ABC):
+    """Base class for connections driven by an asyncio event loop rather than a reader thread.
+
+    Received data is framed into lines and passed to the line_received callback,
+    which is invoked on the event loop.  The connection_lost callback is invoked
+    (with an exception or None) when the link closes.
+    """
+
+    def __init__(self):
+        self.line_received = lambda line: None
+        """Callback invoked on the event loop with each line (str) received from the hub."""
+
+        self.connection_lost = lambda ex: None
+        """Callback invoked on the event loop when the link is closed."""
+
+        self._framer = LineFramer()
+
+    @property
+    @abstractmethod
+    def name(self):
+        """User-visible name of the connection."""
+        pass
+
+    @abstractmethod
+    async def open(self):
+        """Open the connection on the running event loop."""
+        pass
+
+    @abstractmethod
+    def close(self):
+        """Shut down the connection."""
+        pass
+
+    @abstractmethod
+    def write(self, line : str):
+        """Send a line of text to the hub.  A CR will be appended before sending."""
+        pass
+
+    def _data_received(self, data):
+        for line in self._framer.feed(data):
+            self.line_received(line)
+
+
+class AsyncSerialConnection(AsyncConnection):
+    """Serial port connection whose file descriptor is watched by the event loop.
+
+    Requires a platform where the event loop supports add_reader on a tty (i.e. not Windows).
+    """
+
+    def __init__(self, port, read_size = 4096):
+        super().__init__()
+        import serial
+        self._serial = serial.Serial()
+        self._serial.port = port
+        self._serial.timeout = 0
+        self._read_size = read_size
+        self._loop = None
+
+    @property
+    def name(self): return self._serial.port
+
+    async def open(self):
+        self._loop = asyncio.get_running_loop()
+        self._serial.open()
+        self._loop.add_reader(self._serial.fileno(), self._on_readable)
+        logger.info('async serial connection open on %s', self.name)
+
+    def close(self):
+        if not self._serial.is_open: return
+        self._loop.remove_reader(self._serial.fileno())
+        self._serial.close()
+        self.connection_lost(None)
+
+    def write(self, line : str):
+        logger.debug('SEND: %s', line)
+        self._serial.write((line + '\r').encode(LINE_ENCODING))
+
+    def _on_readable(self):
+        try:
+            data = os.read(self._serial.fileno(), self._read_size)
+        except OSError as ex:
+            logger.info('serial read failed on %s: %s', self.name, ex)
+            self._loop.remove_reader(self._serial.fileno())
+            self._serial.close()
+            self.connection_lost(ex)
+            return
+        if not data:
+            self.close()
+            return
+        self._data_received(data)
+
+
+class _SocketProtocol(asyncio.Protocol):
+    def __init__(self, connection):
+        self._connection = connection
+
+    def data_received(self, data):
+        self._connection._data_received(data)
+
+    def connection_lost(self, ex):
+        self._connection.connection_lost(ex)
+
+
+class AsyncBluetoothConnection(AsyncConnection):
+    """Bluetooth RFCOMM connection using an asyncio socket transport."""
+
+    def __init__(self, address, port):
+        super().__init__()
+        self.address = address
+        self.port = port
+        self._transport = None
+
+    @property
+    def name(self): return self.address
+
+    async def open(self):
+        loop = asyncio.get_running_loop()
+        s = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
+        s.setblocking(False)
+        await loop.sock_connect(s, (self.address, self.port))
+        (self._transport, _) = await loop.create_connection(lambda: _SocketProtocol(self), sock=s)
+        logger.info('async bluetooth connection open to %s port %s', self.address, self.port)
+
+    def close(self):
+        if self._transport is not None:
+            self._transport.close()
+            self._transport = None
+
+    def write(self, line : str):
+        logger.debug('SEND: %s', line)
+        self._transport.write((line + '\r').encode(LINE_ENCODING))
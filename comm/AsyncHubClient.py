@@ -0,0 +1,201 @@
+import asyncio
+import base64
+from collections import deque
+import datetime
+import json
+import logging
+
+from comm.AsyncConnection import AsyncConnection
+from comm.HubClient import ConnectionState
+from comm.HubRpc import ConnectionChangedError, HubError
+from comm.TelemetryDecoder import TelemetryDecoder
+from comm.TelemetryDispatcher import STATUS_MESSAGE_TYPES
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+
+
+class TelemetryQueue(object):
+    """Telemetry waiting for one telemetry() iterator.
+
+    Holds at most maxsize messages as long as it can: when full, the oldest queued status
+    frame (m:0 / m:2) is discarded.  Other messages, such as userProgram.print requests the
+    hub waits to have acknowledged, are never discarded; without a status frame to give
+    way, the queue grows beyond maxsize.
+    """
+
+    def __init__(self, maxsize) -> None:
+        self.maxsize = maxsize
+        self._items = deque()
+        self._ready = asyncio.Event()
+
+    def put(self, item):
+        """Queue a (timestamp, message) pair, or None to end iteration."""
+        if len(self._items) >= self.maxsize:
+            for queued in self._items:
+                if queued is not None and queued[1].get('m') in STATUS_MESSAGE_TYPES:
+                    self._items.remove(queued)
+                    break
+        self._items.append(item)
+        self._ready.set()
+
+    async def get(self):
+        while not self._items:
+            self._ready.clear()
+            await self._ready.wait()
+        return self._items.popleft()
+
+
+class AsyncHubClient(object):
+    """asyncio counterpart of HubClient.
+
+    All I/O and message dispatch happens on the event loop that calls connect(), so
+    several hubs and the application's own logic can share one loop without reader
+    threads or cross-thread hand-offs.
+
+    Usage:
+        client = AsyncHubClient(AsyncSerialConnection('/dev/ttyACM0'))
+        await client.connect()
+        info = await client.call('get_hub_info')
+        async for (timestamp, message) in client.telemetry():
+            ...
+    """
+
+    def __init__(self, connection : AsyncConnection):
+        self._connection = connection
+        self._connection.line_received = self._on_line_received
+        self._connection.connection_lost = self._on_connection_lost
+
+        self._decoder = TelemetryDecoder()
+        self._pending_requests = {}
+        self._subscribers = []
+        self._telemetry_ready = None
+
+        self.state = ConnectionState.DISCONNECTED
+        """state of the hub connection"""
+
+    @property
+    def connection(self): return self._connection
+
+    async def connect(self):
+        """Open the connection and wait until the hub is sending telemetry."""
+        self._telemetry_ready = asyncio.Event()
+        self.state = ConnectionState.CONNECTING
+        await self._connection.open()
+        await self._telemetry_ready.wait()
+        if self.state != ConnectionState.TELEMETRY:
+            raise ConnectionError('connection to %s lost before telemetry started' % self._connection.name)
+
+    async def close(self):
+        self._connection.close()
+
+    def _gen_message_id(self):
+        import string, random
+        length = 4
+        letters = string.ascii_letters + string.digits + '_'
+        return ''.join(random.choice(letters) for _ in range(length))
+
+    async def call(self, name : str, params = {}):
+        """Send a message and return its response.
+
+        Any number of calls may be in flight; responses are matched by message id.
+        As HubClient.send_request, raises HubError (a ConnectionError) if the hub reports
+        an error, and ConnectionChangedError if the link is lost before the response arrives.
+        Raises ConnectionError if the hub is not connected.
+        """
+        if self.state != ConnectionState.TELEMETRY:
+            raise ConnectionError('hub not connected (state %s)' % self.state)
+
+        id = self._gen_message_id()
+        while id in self._pending_requests:
+            id = self._gen_message_id()
+        future = asyncio.get_running_loop().create_future()
+        self._pending_requests[id] = future
+        try:
+            self._connection.write(json.dumps({'m': name, 'p': params, 'i': id}))
+            return await future
+        finally:
+            self._pending_requests.pop(id, None)
+
+    def send_response(self, id : str, response = None):
+        """Send a response to a request initiated by the hub (e.g. userProgram.print)."""
+        self._connection.write(json.dumps({'i': id, 'r': response}))
+
+    async def telemetry(self, maxsize = 100):
+        """Asynchronously iterate over (timestamp, message) telemetry pairs.
+
+        Each iterator has its own queue holding at most maxsize messages; when a
+        consumer falls behind, its oldest status frames are dropped (see TelemetryQueue).
+        Iteration ends when the connection is lost.
+        """
+        queue = TelemetryQueue(maxsize)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                item = await queue.get()
+                if item is None: return
+                yield item
+        finally:
+            self._subscribers.remove(queue)
+
+    def _on_line_received(self, line):
+        line = line.strip()
+        if self.state == ConnectionState.CONNECTING:
+            if len(line) > 0 and line[0] == '{':
+                self.state = ConnectionState.TELEMETRY
+                self._telemetry_ready.set()
+            else:
+                logger.info('CONNECTING: %s', line)
+                return
+
+        try:
+            message = self._decoder.decode(line)
+        except json.JSONDecodeError:
+            logger.warn('failed to decode JSON message: %s', line)
+            return
+        if message is None:
+            logger.info('received non-JSON: %s', line)
+            return
+        self._process_message(message)
+
+    def _process_message(self, message):
+        if 'm' in message:
+            item = (datetime.datetime.now(), message)
+            for queue in self._subscribers:
+                queue.put(item)
+        elif 'i' in message:
+            self._resolve_request(message)
+        else:
+            logger.warn('unhandled message: %s', message)
+
+    def _resolve_request(self, resp):
+        future = self._pending_requests.pop(resp['i'], None)
+        if future is None or future.done():
+            logger.warn('ignored response: %s', resp)
+            return
+        if 'r' in resp:
+            future.set_result(resp['r'])
+            return
+        if 'e' in resp:
+            try:
+                error = json.loads(base64.b64decode(resp['e']).decode(LINE_ENCODING))
+            except Exception:
+                error = resp['e']
+        else:
+            error = 'unrecognized response message: %s' % resp
+        future.set_exception(HubError(error))
+
+    def _on_connection_lost(self, ex):
+        logger.info('Hub disconnected from %s', self._connection.name)
+        self.state = ConnectionState.DISCONNECTED
+        if self._telemetry_ready is not None:
+            self._telemetry_ready.set()
+        pending = self._pending_requests
+        self._pending_requests = {}
+        for future in pending.values():
+            if not future.done():
+                future.set_exception(ConnectionChangedError('hub connection lost'))
+        for queue in self._subscribers:
+            queue.put(None)
@@ -1,5 +1,7 @@
 import logging
 from comm.Connection import Connection
+from comm.LineFramer import LineFramer
+import comm.Reactor
 import threading
 import select
 import socket
@@ -8,10 +10,12 @@ import socket
 logger = logging.getLogger(__name__)
 
 LINE_ENCODING = 'utf-8'
-CR = 13 # Carriage Return
 
 class BluetoothConnection(Connection):
     """Bluetooth RFCOMM-based communication with lego hub.
+
+    Where supported, the socket is read by the shared I/O reactor (see comm.Reactor);
+    otherwise the connection starts its own reader thread.
     """
 
     def __init__(self, address, port):
@@ -24,26 +28,43 @@ class BluetoothConnection(Connection):
         self._socket = None
         self.address = address
         self.port = port
+        self._reactor = None
+        self._fd = None
 
         self._opencloselock = threading.Lock()
 
     @property
     def name(self): return self.address
 
+    @property
+    def is_open(self):
+        """True if the socket is connected and has not been closed."""
+        return self._socket is not None and self._socket.fileno() >= 0
+
     def open(self):
+        """Connect the socket.  Does nothing if already open (e.g. a hot-standby link)."""
         logger.debug('open socket to %s port %s', self.address, self.port)
         self._opencloselock.acquire()
         try:
+            if self.is_open: return
             s = socket.socket(socket.AF_BLUETOOTH, socket.SOCK_STREAM, socket.BTPROTO_RFCOMM)
             s.connect((self.address, self.port))
             s.setblocking(False)
             self._socket = s
-            self._start_monitor_loop()
+            self._reactor = comm.Reactor.shared_reactor()
+            if self._reactor is not None:
+                self._start_reactor_reads()
+            else:
+                self._start_monitor_loop()
         finally:
             self._opencloselock.release()
 
     def close(self):
         self._is_monitor_loop_active = False
+        if self._fd is not None:
+            # Must not hold the open/close lock: the reactor thread may be closing too
+            self._reactor.remove_reader(self._fd)
+            self._fd = None
 
         logger.debug('closing socket to %s', self.address)
         self._opencloselock.acquire()
@@ -63,11 +84,43 @@ class BluetoothConnection(Connection):
         """Send a line of text to the hub.  A CR will be appended before sending."""
 
         logger.debug('SEND: %s', line)
+        self.events.line_sent(line)
         data = (line + '\r').encode(LINE_ENCODING)
         written = self._socket.send(data)
         if written != len(data):
             logger.warn('wrote %d of %d bytes for line "%s"', written, len(data), line)
 
+    def _start_reactor_reads(self):
+        logger.info('begin reactor reads on device %s', self.address)
+        self._lines_to_log = 10
+        self._framer = LineFramer(instrumentation=self.instrumentation)
+        self._fd = self._socket.fileno()
+        self._reactor.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        """Called on the reactor thread when the socket has data."""
+        try:
+            data = self._socket.recv(4096)
+        except BlockingIOError:
+            return
+        except Exception as ex:
+            logger.info('socket read failed on %s: %s', self.address, ex)
+            self.close()
+            return
+        if not data:
+            logger.info('socket closed by %s', self.address)
+            self.close()
+            return
+        try:
+            for line in self._framer.feed(data):
+                self.events.line_received(line)
+                if self._lines_to_log > 0:
+                    logger.debug('RECV: %s', line)
+                    self._lines_to_log -= 1
+        except Exception as ex:
+            logger.exception('reactor read exception: %s', ex)
+            self.close()
+
     def _start_monitor_loop(self):
         self._is_monitor_loop_active = True
         self._monitor_thread = threading.Thread(target=self._monitor_loop, name='BluetoothSocketRead')
@@ -79,7 +132,7 @@ class BluetoothConnection(Connection):
             logger.info('begin monitoring loop on device %s', self.address)
             
             lines_to_log = 10
-            buffer = bytearray()
+            framer = LineFramer(instrumentation=self.instrumentation)
             inputs = [self._socket]
             while self._is_monitor_loop_active and self._socket.fileno() >= 0:
                 readable, writable, exceptional = select.select(inputs, [], inputs)
@@ -88,11 +141,7 @@ class BluetoothConnection(Connection):
                     break
                 if not readable:
                     continue
-                buffer = buffer + self._socket.recv(1024)
-                pos = buffer.find(CR)
-                if pos >= 0:
-                    line = buffer[:pos].decode(LINE_ENCODING)
-                    buffer = buffer[pos+1:]
+                for line in framer.feed(self._socket.recv(1024)):
                     self.events.line_received(line)
                     if lines_to_log > 0:
                         logger.debug('RECV: %s', line)
@@ -1,5 +1,5 @@
 import logging
-import time
+import threading
 
 import bluetooth
 from events import Events
@@ -9,8 +9,10 @@ from comm.ConnectionMonitor import ConnectionMonitor
 
 logger = logging.getLogger(__name__)
 
-# Bluetooth poll interval
-poll_interval = 5
+# Default scan timings (seconds); see BluetoothConnectionMonitor
+scan_interval_min = 1
+scan_interval_max = 30
+scan_backoff = 2
 
 
 class BluetoothConnectionMonitor(ConnectionMonitor):
@@ -19,8 +21,19 @@ class BluetoothConnectionMonitor(ConnectionMonitor):
     Call method start() to initiate bluetooth monitoring.
     The selected set of ports is available using method ports(),
     and, when changed, event ports_changed is raised.
+
+    Presence scans (bluetooth.lookup_name) adapt to the situation:
+      * right after a change -- the link dropping, the hub appearing or disappearing --
+        the hub is scanned every interval_min seconds;
+      * while nothing changes, the interval grows by a factor of backoff up to
+        interval_max, so an absent hub costs little radio time;
+      * while the connection handed out -- or another link to the hub, as reported by
+        link_open() -- is open, no scans are made at all; the link is checked every
+        interval_min seconds, and when it drops the hub is reported offline and scanned
+        for again immediately.
+    Call wake() to scan immediately, e.g. when another link to the hub is lost.
     """
-    def __init__(self, target_address, port):
+    def __init__(self, target_address, port, interval_min = None, interval_max = None, backoff = None, link_open = None):
         super().__init__("Bluetooth", self._thread_work)
         
         self.is_online = False
@@ -32,12 +45,38 @@ class BluetoothConnectionMonitor(ConnectionMonitor):
         self.port = port
         """Bluetooth device port for RFCOMM"""
 
+        self.interval_min = interval_min if interval_min is not None else scan_interval_min
+        """Seconds between scans after a change."""
+
+        self.interval_max = interval_max if interval_max is not None else scan_interval_max
+        """Longest time between scans while nothing changes."""
+
+        self.backoff = backoff if backoff is not None else scan_backoff
+        """Factor by which the scan interval grows after each unchanged result."""
+
+        self.scan_count = 0
+        """Number of presence scans made."""
+
+        self.link_open = link_open
+        """Optional function returning True while a Bluetooth link to the hub opened by someone
+        else is open (e.g. MultiplexedConnectionMonitor's hot-standby link); scans pause then too."""
+
+        self._wakeup = threading.Event()
+
     def is_online(self):
         return self.is_online
 
     def reset(self):
         self.is_online = False
 
+    def wake(self):
+        """Scan now rather than at the next scheduled time."""
+        self._wakeup.set()
+
+    def stop(self):
+        super().stop()
+        self._wakeup.set()
+
     def _set_scan_result(self, is_online):        
         if self.is_online == is_online: return
         self.is_online = is_online
@@ -47,18 +86,48 @@ class BluetoothConnectionMonitor(ConnectionMonitor):
         else:
             self.notify_change(None)
 
+    def _is_link_open(self):
+        conn = self.connection
+        if conn is not None and conn.is_open: return True
+        return self.link_open is not None and self.link_open()
+
+    def _wait(self, seconds):
+        """Sleep for the given time; returns True if woken early."""
+        woken = self._wakeup.wait(seconds)
+        self._wakeup.clear()
+        return woken
+
     def _thread_work(self):
         if self.target_address is None:
             logger.warn('Not scanning: no BlueTooth address configured')
             return
         lookup_prev = None
+        interval = self.interval_min
         while self.is_scan_active:
             try:
-                time.sleep(poll_interval)
+                if self._is_link_open():
+                    # Healthy link: no radio scans, just watch for it to drop
+                    while self.is_scan_active and self._is_link_open():
+                        self._wait(self.interval_min)
+                    if not self.is_scan_active: break
+                    logger.info('BlueTooth link to %s dropped; rescanning', self.target_address)
+                    self._set_scan_result(False)
+                    lookup_prev = None
+                    interval = self.interval_min
+                elif self._wait(interval):
+                    interval = self.interval_min
+                if not self.is_scan_active: break
+                if self._is_link_open(): continue # opened while waiting
+
                 lookup = bluetooth.lookup_name(address = self.target_address)
+                self.scan_count += 1
                 if lookup != lookup_prev:
                     logger.info('BlueTooth scan result: %s --> %s', lookup_prev, lookup)
                     self._set_scan_result(lookup is not None)
                     lookup_prev = lookup
+                    interval = self.interval_min
+                else:
+                    interval = min(interval * self.backoff, self.interval_max)
             except Exception:
                 logger.exception('failure in bluetooth scan loop')
+                self._wait(interval)
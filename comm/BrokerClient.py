@@ -0,0 +1,148 @@
+from concurrent.futures import Future
+import json
+import logging
+import os
+import socket
+import threading
+
+import appdirs
+from events import Events
+
+from comm.HubRpc import ConnectionChangedError, HubError
+from data.ProgramRunState import ProgramRunState
+from utils.LockedCounter import LockedCounter
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+
+ERROR_TYPES = {
+    'TimeoutError': TimeoutError,
+    'ConnectionError': ConnectionError,
+    'ConnectionChangedError': ConnectionChangedError,
+    'HubError': HubError,
+    'ValueError': ValueError,
+}
+"""Exceptions re-raised by BrokerClient, by the type name reported by the broker."""
+
+
+def default_socket_path():
+    """Socket used by hub_daemon.py unless told otherwise."""
+    return os.path.join(appdirs.user_cache_dir('lego-hub-tk'), 'hub.sock')
+
+
+class BrokerClient(object):
+    """Attaches to a HubBroker (see hub_daemon.py) in place of opening the hub directly.
+
+    Provides the parts of HubClient and HubMonitor used by command-line tools:
+    send_request, send_message, get_storage_status, wait_for_telemetry, execution_status,
+    program_end_future, wait_for_program_end and the console_print event.  See
+    HubBroker for the protocol.
+
+    Call connect() first; it raises OSError if no daemon is listening.
+    """
+
+    def __init__(self, path = None) -> None:
+        self.path = path if path is not None else default_socket_path()
+        self._sock = None
+        self._pending_requests = {}
+        self._pending_lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._id_counter = LockedCounter(0)
+
+        self.events = Events(('console_print'))
+        """Event raised with the output of print() in the user program on the hub."""
+
+        self._run_state = ProgramRunState()
+
+    @property
+    def execution_status(self):
+        """(project_id, is_running) of the last program run-state change reported by the hub."""
+        return self._run_state.status
+
+    def program_end_future(self, project_id = None):
+        return self._run_state.program_end_future(project_id)
+
+    def wait_for_program_end(self, project_id = None, timeout = None) -> bool:
+        return self._run_state.wait_for_program_end(project_id, timeout)
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+        except OSError:
+            sock.close()
+            raise
+        self._sock = sock
+        thread = threading.Thread(target=self._read_loop, name='BrokerClientRead')
+        thread.daemon = True
+        thread.start()
+        logger.info('attached to hub daemon at %s', self.path)
+
+    def close(self):
+        if self._sock is not None:
+            self._sock.close()
+
+    def send_request(self, name:str, params = {}, timeout = None, retries = 0) -> Future:
+        """Send a hub method call; return a Future that resolves to the response.
+
+        timeout and retries are applied by the daemon, as for HubClient.send_message.
+        """
+        future = Future()
+        id = str(self._id_counter.next_value())
+        with self._pending_lock:
+            self._pending_requests[id] = future
+        message = {'i': id, 'm': name, 'p': params, 't': timeout, 'n': retries}
+        data = (json.dumps(message) + '\n').encode(LINE_ENCODING)
+        try:
+            with self._write_lock:
+                self._sock.sendall(data)
+        except OSError as ex:
+            with self._pending_lock:
+                self._pending_requests.pop(id, None)
+            raise ConnectionError('lost connection to hub daemon: %s' % ex)
+        return future
+
+    def send_message(self, name:str, params = {}, timeout = None, retries = 0):
+        """Send a hub method call and return the response."""
+        return self.send_request(name, params, timeout, retries).result()
+
+    def get_storage_status(self, timeout = None, retries = 0):
+        """The hub's storage status, from the daemon's cache where possible."""
+        return self.send_message('get_storage_status', {}, timeout, retries)
+
+    def wait_for_telemetry(self, timeout = None) -> bool:
+        """Wait until the daemon's hub connection reaches state TELEMETRY; False on timeout."""
+        return self.send_message('broker.wait_for_telemetry', {'timeout': timeout})
+
+    def _read_loop(self):
+        try:
+            with self._sock.makefile('r', encoding=LINE_ENCODING) as lines:
+                for line in lines:
+                    self._on_message(json.loads(line))
+        except (OSError, ValueError) as ex:
+            logger.info('hub daemon connection ended: %s', ex)
+        with self._pending_lock:
+            pending = self._pending_requests
+            self._pending_requests = {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ConnectionError('hub daemon closed the connection'))
+
+    def _on_message(self, message):
+        if 'i' in message:
+            with self._pending_lock:
+                future = self._pending_requests.pop(message['i'], None)
+            if future is None or not future.set_running_or_notify_cancel():
+                return
+            if 'r' in message:
+                future.set_result(message['r'])
+            else:
+                error = message['e']
+                exception_type = ERROR_TYPES.get(error['type'], RuntimeError)
+                future.set_exception(exception_type(error['message']))
+        elif message['m'] == 'console_print':
+            self.events.console_print(message['p'])
+        elif message['m'] == 12:
+            self._run_state.update(*message['p'])
@@ -0,0 +1,89 @@
+import logging
+import re
+import threading
+import time
+
+from comm.Connection import Connection
+
+
+logger = logging.getLogger(__name__)
+
+CAPTURE_HEADER = '# lego-hub-tk capture v1'
+
+RECEIVED = 'R'
+SENT = 'S'
+
+# Capture file format
+# ===================
+#
+# A text file; the first line is the header, followed by one record per line:
+#
+#     <nanoseconds>\t<direction>\t<line>
+#
+# nanoseconds: monotonic time since the capture started
+# direction:   R for a line received from the hub, S for a line sent to it
+# line:        the line text, without its CR; backslash and newline are escaped as \\ and \n
+
+
+def _escape(line):
+    return line.replace('\\', '\\\\').replace('\n', '\\n')
+
+_escape_sequence = re.compile(r'\\(.)')
+
+def _unescape(text):
+    if '\\' not in text: return text
+    return _escape_sequence.sub(lambda m: '\n' if m[1] == 'n' else m[1], text)
+
+
+class CaptureWriter(object):
+    """Record the lines received and sent by connections to a capture file.
+
+    Call attach() for each connection to record.  Recording costs one buffered
+    file write per line.
+    """
+
+    def __init__(self, filename) -> None:
+        self.filename = filename
+        self._file = open(filename, 'w', buffering=64 * 1024)
+        self._file.write('%s %s\n' % (CAPTURE_HEADER, time.strftime('%Y-%m-%dT%H:%M:%S%z')))
+        self._start_ns = time.monotonic_ns()
+        self._lock = threading.Lock()
+
+    def attach(self, connection : Connection):
+        connection.events.line_received += self.record_received
+        connection.events.line_sent += self.record_sent
+
+    def detach(self, connection : Connection):
+        connection.events.line_received -= self.record_received
+        connection.events.line_sent -= self.record_sent
+
+    def record_received(self, line):
+        self._record(RECEIVED, line)
+
+    def record_sent(self, line):
+        self._record(SENT, line)
+
+    def _record(self, direction, line):
+        record = '%d\t%s\t%s\n' % (time.monotonic_ns() - self._start_ns, direction, _escape(line))
+        with self._lock:
+            if self._file is not None:
+                self._file.write(record)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_capture(filename):
+    """Read a capture file; returns a list of (nanoseconds, direction, line) tuples."""
+    records = []
+    with open(filename, 'r') as f:
+        header = f.readline()
+        if not header.startswith(CAPTURE_HEADER):
+            raise ValueError('not a capture file: %s' % filename)
+        for text in f:
+            (ns, direction, line) = text.rstrip('\n').split('\t', 2)
+            records.append((int(ns), direction, _unescape(line)))
+    return records
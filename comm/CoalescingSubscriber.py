@@ -0,0 +1,94 @@
+from collections import deque
+import logging
+import threading
+
+from comm.TelemetryDispatcher import STATUS_MESSAGE_TYPES
+
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescingSubscriber(object):
+    """Telemetry subscriber that delivers only the newest frame of selected message types.
+
+    Messages are delivered to the handler on the subscriber's own thread.  For message
+    types listed in coalesce_types, at most one message of each type waits for delivery:
+    a newer frame replaces the pending one, keeping its place in the delivery order.
+    All other message types (button events, gestures, program run state, ...) are
+    queued and delivered in full.
+
+    A slow consumer -- plotting, network forwarding -- therefore always sees fresh
+    status without building up a backlog, and without slowing other subscribers.
+
+    Arguments:
+        handler : function
+            called as handler(timestamp, message)
+        coalesce_types : iterable
+            message types ('m' values) to coalesce; default m:0 and m:2
+    """
+
+    def __init__(self, handler, coalesce_types = STATUS_MESSAGE_TYPES) -> None:
+        self._handler = handler
+        self.coalesce_types = frozenset(coalesce_types)
+
+        self._order = deque()
+        """Pending deliveries: either a coalesced message type, or a (timestamp, message) pair."""
+        self._latest = {}
+        """Newest pending (timestamp, message) for each coalesced type."""
+        self._condition = threading.Condition()
+        self._is_active = True
+        self._delivered = 0
+        self._coalesced = 0
+
+        self._thread = threading.Thread(target=self._delivery_loop, name='CoalescingSubscriber')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def counters(self):
+        """Snapshot of counters: pending, delivered, coalesced (superseded frames not delivered)."""
+        with self._condition:
+            return {
+                'pending': len(self._order),
+                'delivered': self._delivered,
+                'coalesced': self._coalesced,
+            }
+
+    def put(self, timestamp, message):
+        """Accept a telemetry message; signature matches the telemetry_update event."""
+        msgtype = message.get('m')
+        with self._condition:
+            if msgtype in self.coalesce_types:
+                if msgtype in self._latest:
+                    self._coalesced += 1
+                else:
+                    self._order.append(msgtype)
+                self._latest[msgtype] = (timestamp, message)
+            else:
+                self._order.append((timestamp, message))
+            self._condition.notify()
+
+    def stop(self):
+        """Stop delivering messages; pending messages are discarded."""
+        with self._condition:
+            self._is_active = False
+            self._order.clear()
+            self._latest.clear()
+            self._condition.notify()
+
+    def _delivery_loop(self):
+        while True:
+            with self._condition:
+                while self._is_active and not self._order:
+                    self._condition.wait()
+                if not self._is_active: return
+                entry = self._order.popleft()
+                if isinstance(entry, tuple):
+                    (timestamp, message) = entry
+                else:
+                    (timestamp, message) = self._latest.pop(entry)
+            try:
+                self._handler(timestamp, message)
+            except Exception as ex:
+                logger.exception('telemetry subscriber exception: %s', ex)
+            with self._condition:
+                self._delivered += 1
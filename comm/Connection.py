@@ -7,12 +7,16 @@ class Connection(ABC):
 
     def __init__(self):
 
-        self.events = Events(('line_received'))
+        self.events = Events(('line_received', 'line_sent'))
         """Events raised by a Connection:
 
             line_recieved(line : bytearray) - provides raw text received from hub.
+            line_sent(line : str) - provides text written to hub (without the CR).
         """
 
+        self.instrumentation = None
+        """Instrumentation (see utils.Instrumentation) to record read-side statistics; set by HubClient."""
+
     @property
     @abstractmethod
     def name(self):
@@ -32,6 +36,12 @@ class Connection(ABC):
         """Shut down the connection.  This object is not to be re-used."""
         pass
 
+    def is_finished(self):
+        """True once the connection has nothing more to deliver, e.g. a replay that has played out.
+
+        HubClient's telemetry watchdog does not reopen a finished connection."""
+        return False
+
     @abstractmethod
     def write(self, line : bytearray):
         """Send a line of text to the hub.  A CR will be appended before sending."""
@@ -22,8 +22,19 @@ def make_connection_monitor(config):
     else:
         raise ValueError("configuration parameter connection has invalid value: " + connection_type)
 
+def serial_options(config):
+    """Keyword arguments for SerialConnection taken from the serial configuration."""
+    serial_config = config['serial'] if 'serial' in config else {}
+    return {key: serial_config[key] for key in ('read_size', 'read_latency') if key in serial_config}
+
+def bluetooth_scan_options(config):
+    """Keyword arguments for BluetoothConnectionMonitor taken from the bluetooth configuration."""
+    bt_config = config['bluetooth'] if 'bluetooth' in config else {}
+    names = {'scan_interval_min': 'interval_min', 'scan_interval_max': 'interval_max', 'scan_backoff': 'backoff'}
+    return {names[key]: bt_config[key] for key in names if key in bt_config}
+
 def make_connection_monitor_serial(config):
-    if 'serial' in config:
+    if 'serial' in config and 'device' in config['serial']:
         device_name = config['serial']['device']
     else:
         device_name = 'auto'
@@ -32,10 +43,10 @@ def make_connection_monitor_serial(config):
     
     if device_name == 'auto':
         from comm.UsbConnectionMonitor import UsbConnectionMonitor
-        return UsbConnectionMonitor()
+        return UsbConnectionMonitor(**serial_options(config))
     else:
         from comm.SerialConnection import SerialConnection
-        return DirectConnectionMonitor(SerialConnection(device_name))
+        return DirectConnectionMonitor(SerialConnection(device_name, **serial_options(config)))
 
 def make_connection_monitor_bluetooth(config):
     bt_params = config['bluetooth']
@@ -45,4 +56,36 @@ def make_connection_monitor_bluetooth(config):
 def make_connection_monitor_multiplexed(config):
     bt_params = config['bluetooth']
     from comm.MultiplexedConnectionMonitor import MultiplexedConnectionMonitor
-    return MultiplexedConnectionMonitor(bt_params['address'], bt_params['port'])
+    hot_standby = bool(bt_params['hot_standby']) if 'hot_standby' in bt_params else False
+    race_startup = bool(bt_params['race_startup']) if 'race_startup' in bt_params else False
+    race_timeout = float(bt_params['race_timeout']) if 'race_timeout' in bt_params else 10
+    return MultiplexedConnectionMonitor(bt_params['address'], bt_params['port'], serial_options(config), hot_standby, race_startup,
+                                        bluetooth_scan_options(config), race_timeout)
+
+def make_async_connection(config):
+    """Construct an AsyncConnection for use with AsyncHubClient, based on configuration.
+
+    For multiplexed configuration, a USB device is preferred if one is present; otherwise Bluetooth is used.
+    """
+    connection_type = config['connection'] if 'connection' in config else 'serial'
+
+    if connection_type == 'bluetooth':
+        bt_params = config['bluetooth']
+        from comm.AsyncConnection import AsyncBluetoothConnection
+        return AsyncBluetoothConnection(bt_params['address'], bt_params['port'])
+
+    serial_config = config['serial'] if 'serial' in config else {}
+    device_name = serial_config['device'] if 'device' in serial_config else 'auto'
+    if device_name == 'auto':
+        from comm.UsbConnectionMonitor import connected_comports
+        devices = connected_comports()
+        if len(devices) == 0:
+            if connection_type == 'multiplexed':
+                bt_params = config['bluetooth']
+                from comm.AsyncConnection import AsyncBluetoothConnection
+                return AsyncBluetoothConnection(bt_params['address'], bt_params['port'])
+            raise ConnectionError('no LEGO hub found on USB')
+        device_name = devices[0].device
+
+    from comm.AsyncConnection import AsyncSerialConnection
+    return AsyncSerialConnection(device_name)
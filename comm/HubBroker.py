@@ -0,0 +1,210 @@
+from concurrent.futures import Future, ThreadPoolExecutor
+import concurrent.futures
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+
+from comm.HubClient import HubClient
+from data.HubMonitor import HubMonitor
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+
+
+class HubBroker(object):
+    """Serves one hub connection to other processes over a Unix socket.
+
+    A long-running process (see hub_daemon.py) owns the HubClient, so that short-lived
+    tools such as run_command.py need not open the port and wait for telemetry each
+    time; they attach with BrokerClient instead.
+
+    The protocol is newline-delimited JSON, modelled on the hub's own:
+        request      {"i": id, "m": method, "p": params, "t": timeout, "n": retries}
+        response     {"i": id, "r": result}  or  {"i": id, "e": {"type": ..., "message": ...}}
+        notification {"m": "console_print", "p": text}  or  {"m": 12, "p": [project_id, is_running]}
+    Hub methods are forwarded with HubClient.send_message (t and n are its timeout and
+    retries).  Methods broker.wait_for_telemetry (p: {"timeout": seconds}) and
+    broker.status are answered by the broker itself, and get_storage_status from the
+    client's storage status cache where possible.  Requests from one client reach the
+    hub in the order they were received, but are answered concurrently, so responses
+    may arrive out of order.
+
+    Arguments:
+        client : HubClient
+            started client owning the hub connection
+        monitor : HubMonitor
+            monitor of client; its console output is forwarded to all attached clients
+        path : str
+            filesystem path of the socket
+    """
+
+    def __init__(self, client : HubClient, monitor : HubMonitor, path, max_workers = 16) -> None:
+        self._client = client
+        self._monitor = monitor
+        self.path = path
+        self._executor = ThreadPoolExecutor(max_workers, thread_name_prefix='HubBroker')
+        self._listener = None
+        self._sessions = {}
+        """Attached clients: socket -> write lock."""
+        self._sessions_lock = threading.Lock()
+
+        self.requests_handled = 0
+
+    def start(self):
+        """Listen on the socket.  Raises RuntimeError if another broker is already listening."""
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+                raise RuntimeError('a hub daemon is already listening on %s' % self.path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.unlink(self.path) # stale socket from a previous run
+            finally:
+                probe.close()
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        # Bind in a private (0700) directory and move the socket into place once it is
+        # accessible to the owner only, so that it is never open to others
+        private_dir = tempfile.mkdtemp(dir=os.path.dirname(self.path))
+        try:
+            private_path = os.path.join(private_dir, os.path.basename(self.path))
+            self._listener.bind(private_path)
+            os.chmod(private_path, 0o600)
+            os.rename(private_path, self.path)
+        finally:
+            os.rmdir(private_dir)
+        self._listener.listen()
+
+        self._client.events.telemetry_update += self._on_telemetry_update
+        self._monitor.events.console_print += self._on_console_print
+
+        thread = threading.Thread(target=self._accept_loop, name='HubBrokerAccept')
+        thread.daemon = True
+        thread.start()
+        logger.info('hub broker listening on %s', self.path)
+
+    def stop(self):
+        self._client.events.telemetry_update -= self._on_telemetry_update
+        self._monitor.events.console_print -= self._on_console_print
+        if self._listener is not None:
+            self._listener.close()
+            self._listener = None
+            os.unlink(self.path)
+        with self._sessions_lock:
+            sessions = list(self._sessions)
+        for sock in sessions:
+            sock.close()
+        self._executor.shutdown(wait=False)
+
+    def _accept_loop(self):
+        try:
+            while True:
+                (sock, _) = self._listener.accept()
+                with self._sessions_lock:
+                    self._sessions[sock] = threading.Lock()
+                thread = threading.Thread(target=self._session_loop, args=(sock,), name='HubBrokerSession')
+                thread.daemon = True
+                thread.start()
+        except OSError:
+            pass # listener closed
+
+    def _session_loop(self, sock):
+        logger.info('client attached')
+        try:
+            with sock.makefile('r', encoding=LINE_ENCODING) as lines:
+                for line in lines:
+                    try:
+                        request = json.loads(line)
+                    except json.JSONDecodeError:
+                        logger.warn('ignoring malformed request: %s', line)
+                        continue
+                    future = self._send_in_order(request)
+                    self._executor.submit(self._call, sock, request, future)
+        except OSError:
+            pass # client went away
+        finally:
+            with self._sessions_lock:
+                self._sessions.pop(sock, None)
+            sock.close()
+        logger.info('client detached')
+
+    def _send_in_order(self, request):
+        """Send a hub method to the hub now, on the session thread, so that a client's requests
+        reach the hub in the order it made them (e.g. the pipelined write_package blocks of an
+        upload).  Only the wait for the response is left to the worker pool.
+
+        Returns the Future of the response, or None if the request is left to _call entirely:
+        broker methods, cached get_storage_status, and requests with retries, which are
+        limited to read-only IDEMPOTENT_METHODS whose order does not matter.
+        """
+        name = request.get('m')
+        if not isinstance(name, str) or name.startswith('broker.') or name == 'get_storage_status' or request.get('n', 0):
+            return None
+        try:
+            return self._client.send_request(name, request['p'] if 'p' in request else {})
+        except Exception as ex:
+            future = Future()
+            future.set_exception(ex)
+            return future
+
+    def _call(self, sock, request, future = None):
+        try:
+            name = request['m']
+            params = request['p'] if 'p' in request else {}
+            if name == 'broker.wait_for_telemetry':
+                result = self._client.wait_for_telemetry(params['timeout'] if 'timeout' in params else None)
+            elif name == 'broker.status':
+                result = {
+                    'state': self._client.state.name,
+                    'connection': self._client.connection.name,
+                    'execution_status': self._monitor.execution_status,
+                }
+            elif future is not None:
+                result = self._wait(name, future, request.get('t'))
+            elif name == 'get_storage_status':
+                result = self._client.get_storage_status(request.get('t'), request.get('n', 0))
+            else:
+                result = self._client.send_message(name, params, request.get('t'), request.get('n', 0))
+            response = {'i': request['i'], 'r': result}
+        except Exception as ex:
+            response = {'i': request['i'], 'e': {'type': type(ex).__name__, 'message': str(ex)}}
+        with self._sessions_lock:
+            self.requests_handled += 1
+        self._send(sock, response)
+
+    def _wait(self, name, future, timeout):
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError('no response to %s within %s seconds' % (name, timeout))
+
+    def _send(self, sock, message):
+        data = (json.dumps(message) + '\n').encode(LINE_ENCODING)
+        with self._sessions_lock:
+            lock = self._sessions.get(sock)
+        if lock is None: return # detached
+        try:
+            with lock:
+                sock.sendall(data)
+        except OSError as ex:
+            logger.info('cannot send to client: %s', ex)
+
+    def _broadcast(self, message):
+        with self._sessions_lock:
+            sessions = list(self._sessions)
+        for sock in sessions:
+            self._send(sock, message)
+
+    def _on_telemetry_update(self, timestamp, message):
+        if message['m'] == 12:
+            self._broadcast({'m': 12, 'p': message['p']})
+
+    def _on_console_print(self, output):
+        self._broadcast({'m': 'console_print', 'p': output})
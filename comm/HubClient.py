@@ -1,29 +1,54 @@
 import comm.ConnectionFactory
+import comm.Reactor
 from comm.Connection import Connection
 import appdirs
-import cfg_load
 import base64
 from utils.LockedCounter import LockedCounter
+from utils.Instrumentation import Instrumentation
 from comm.NullConnection import NullConnection
+from comm.TelemetryDecoder import TelemetryDecoder
+from comm.TelemetryDispatcher import TelemetryDispatcher, STATUS_MESSAGE_TYPES
+from comm.CoalescingSubscriber import CoalescingSubscriber
+from comm.HubRpc import IDEMPOTENT_METHODS, STORAGE_METHODS, ConnectionChangedError, HubError
+from data.StorageStatus import StorageStatus, StorageStatusCache
 import datetime
 import json
 import logging
 import os, os.path
+import time
 from events import Events
-from queue import Queue
+from concurrent.futures import Future
+import concurrent.futures
 from enum import Enum
+import threading
 
 
 logger = logging.getLogger(__name__)
 
 config_file = os.path.join(appdirs.user_config_dir('lego-hub-tk'), 'lego_hub.yaml')
-if os.path.exists(config_file):
-    logger.info('Loading configuration from %s', config_file)
-    config = cfg_load.load(config_file)
-else:
-    # dummy config
-    logger.warn('Configuration file does not exist: %s', config_file)
-    config = {}
+
+_config = None
+
+
+def get_config():
+    """The configuration from config_file, loaded on first use.
+
+    Loading is deferred because cfg_load is slow to import, and tools that attach to
+    the hub daemon never need the configuration.
+    """
+    global _config
+    if _config is None:
+        if os.path.exists(config_file):
+            import cfg_load
+            logger.info('Loading configuration from %s', config_file)
+            _config = cfg_load.load(config_file)
+        else:
+            # dummy config
+            logger.warn('Configuration file does not exist: %s', config_file)
+            _config = {}
+        if 'io_reactor' in _config:
+            comm.Reactor.enabled = comm.Reactor.enabled and bool(_config['io_reactor'])
+    return _config
 
 LINE_ENCODING = 'utf-8'
 
@@ -46,13 +71,39 @@ class HubClient(object):
     
     """
 
-    def __init__(self, cm = None):
-        self._response_queue = Queue()
-        self.events = Events(('connection_state_changed', 'telemetry_update'))
+    def __init__(self, cm = None, dispatch_queue_size = None, dispatch_overflow = None, stall_timeout = None):
+        """Construct the client.
+
+        cm: ConnectionMonitor to use; by default one is made from the configuration file
+        dispatch_queue_size, dispatch_overflow: override the telemetry_dispatch configuration
+            (a queue_size of 0 runs subscribers on the reader thread: configured, it is
+            ignored with the I/O reactor, whose thread must not block)
+        stall_timeout: override the telemetry_watchdog timeout configuration
+        """
+        config = get_config()
+        self._pending_requests = {}
+        """Outstanding requests: maps message id to the Future that receives the response."""
+        self._pending_lock = threading.Lock()
+        self.events = Events(('connection_state_changed', 'telemetry_update', 'telemetry_stalled'))
         self._id_counter = LockedCounter(1000)
+        self._decoder = TelemetryDecoder()
+
+        self.instrumentation = Instrumentation(config['instrumentation'] if 'instrumentation' in config else False)
+        """Receive-pipeline counters and timings; see stats()."""
+
+        dispatch_config = config['telemetry_dispatch'] if 'telemetry_dispatch' in config else {}
+        if dispatch_queue_size is None:
+            dispatch_queue_size = dispatch_config['queue_size'] if 'queue_size' in dispatch_config else 256
+            if dispatch_queue_size <= 0 and comm.Reactor.enabled:
+                logger.warn('telemetry_dispatch queue_size 0 would run subscribers on the I/O reactor thread; using 256')
+                dispatch_queue_size = 256
+        if dispatch_overflow is None:
+            dispatch_overflow = dispatch_config['overflow'] if 'overflow' in dispatch_config else 'block'
+        self._dispatcher = TelemetryDispatcher(self._dispatch_telemetry, dispatch_queue_size, dispatch_overflow, self.instrumentation)
 
         self.state = ConnectionState.DISCONNECTED
         """state of the hub connection"""
+        self._telemetry_ready = threading.Event()
 
         if cm is None:
             cm = comm.ConnectionFactory.make_connection_monitor(config)
@@ -60,41 +111,179 @@ class HubClient(object):
         self._connection_monitor = cm
         self._connection_monitor.events.connection_changed += self._connection_changed
         self._connection = NullConnection() # value managed by connection monitor
+        self._connection_lock = threading.RLock()
+        self._capture = None
+
+        if stall_timeout is None:
+            watchdog_config = config['telemetry_watchdog'] if 'telemetry_watchdog' in config else {}
+            stall_timeout = watchdog_config['timeout'] if 'timeout' in watchdog_config else 5.0
+        self.stall_timeout = stall_timeout
+        """Seconds without a line in state TELEMETRY before the link is declared stalled; 0 disables."""
+        self._watchdog_thread = None
+
+        self._last_telemetry_ns = None
+        """perf_counter_ns() of the last line received in state TELEMETRY."""
+        self._gap_start_ns = None
+        """Set when a connection change interrupts telemetry; cleared once telemetry resumes."""
+        self.last_failover_gap = None
+        """Seconds between the last telemetry on the previous connection and the first on the next."""
+
+        self._storage = StorageStatusCache()
 
     @property
     def connection(self): return self._connection
 
+    def stats(self):
+        """Snapshot of receive-pipeline statistics.
+
+        Per-line counts and timings are only kept with instrumentation enabled (configuration
+        key instrumentation, off by default).  Returns a dict with:
+            counters   -- decode_failures, non_json_lines, unhandled_messages, telemetry_stalls,
+                          rpc_timeouts, ...; lines and bytes if enabled
+            timings_ns -- failover_gap (telemetry gap across connection changes); if enabled,
+                          histogram summaries for framing, decode, dispatch_wait, dispatch,
+                          each telemetry_update and console_print subscriber, and logger
+            dispatch   -- dispatch queue counters
+            storage_cache -- storage status cache hits and misses
+        """
+        stats = self.instrumentation.snapshot()
+        stats['dispatch'] = self._dispatcher.counters()
+        stats['storage_cache'] = {'hits': self._storage.hits, 'misses': self._storage.misses}
+        return stats
+
+    @property
+    def dispatcher(self):
+        """TelemetryDispatcher that delivers telemetry_update events; see its counters()."""
+        return self._dispatcher
+
     def _set_connection_state(self, newstate):
         oldstate = self.state
         self.state = newstate
+        if newstate == ConnectionState.TELEMETRY:
+            self._telemetry_ready.set()
+        else:
+            self._telemetry_ready.clear()
         if oldstate == newstate: return
         logging.info('Connection state change %s --> %s', oldstate, newstate)
         self.events.connection_state_changed(oldstate, newstate)
 
+    def wait_for_telemetry(self, timeout = None) -> bool:
+        """Wait until the hub connection reaches state TELEMETRY.
+
+        Returns True if it has, or False if timeout seconds passed first (None waits forever).
+        """
+        return self._telemetry_ready.wait(timeout)
+
     def start(self):
         """Start monitoring physical connections for LEGO Hub.
         """
         self._connection_monitor.start()
+        if self.stall_timeout and self._watchdog_thread is None:
+            self._watchdog_thread = threading.Thread(target=self._watchdog_loop, name='TelemetryWatchdog')
+            self._watchdog_thread.daemon = True
+            self._watchdog_thread.start()
+
+    def _watchdog_loop(self):
+        """Reopen the connection when telemetry stops arriving.
+
+        The hub streams status frames many times per second, so silence for stall_timeout
+        seconds means the link is stalled even if the port or socket is still open.  The
+        connection is closed and reopened through _connection_changed, which also fails
+        any outstanding requests.  If reopening fails, it is retried every stall_timeout
+        seconds until the connection monitor supplies another connection.  A connection
+        that reports it has finished (a replay that has played out) is left alone.
+        """
+        retry_conn = None
+        while True:
+            timeout = self.stall_timeout
+            time.sleep(min(timeout / 4, 0.5) if timeout else 1.0)
+            if not timeout: continue
+            # decide under the lock, but reopen outside it (see _connection_changed)
+            with self._connection_lock:
+                conn = self._connection
+                if retry_conn is not None and not (isinstance(conn, NullConnection) and self.state == ConnectionState.DISCONNECTED):
+                    retry_conn = None
+                if retry_conn is None:
+                    if self.state != ConnectionState.TELEMETRY: continue
+                    silence = (time.perf_counter_ns() - self._last_telemetry_ns) / 1e9
+                    if silence < timeout or conn.is_finished(): continue
+            if retry_conn is not None:
+                logger.info('watchdog: retrying connection %s', retry_conn.name)
+                self._connection_changed(retry_conn)
+                if self._connection is retry_conn: retry_conn = None
+                continue
+            logger.warn('no telemetry from %s for %.1f seconds; reconnecting', conn.name, silence)
+            self.instrumentation.count('telemetry_stalls')
+            self._connection_changed(conn)
+            if self._connection is not conn:
+                retry_conn = conn
+            self.events.telemetry_stalled(conn.name, silence)
+
+    def start_capture(self, filename):
+        """Record all lines received from and sent to the hub in a capture file.
+
+        The capture follows the client across connection changes.  See comm.Capture for
+        the file format, and ReplayConnection to play it back.
+        """
+        from comm.Capture import CaptureWriter
+        self.stop_capture()
+        self._capture = CaptureWriter(filename)
+        self._capture.attach(self._connection)
+
+    def stop_capture(self):
+        if self._capture is None: return
+        self._capture.detach(self._connection)
+        self._capture.close()
+        self._capture = None
 
     def _connection_changed(self, conn : Connection):
-        try:
-            self._connection.events.line_received -= self._on_line_received
-            self._connection.close()
+        """Close the current connection and open conn, which may be the same one (reopen) or None.
+
+        Only the switch is made under _connection_lock.  Closing and opening happen outside
+        it, as with the I/O reactor they wait for the reactor thread, which itself calls here
+        when udev reports a device change.
+        """
+        with self._connection_lock:
+            old = self._connection
+            if self.state == ConnectionState.TELEMETRY:
+                self._gap_start_ns = self._last_telemetry_ns
+            old.events.line_received -= self._on_line_received
+            if self._capture is not None:
+                self._capture.detach(old)
             if conn is not None:
                 logger.info('Connecting to hub using %s', conn.name)
                 self._connection = conn
-                self._connection.events.line_received += self._on_line_received
+                conn.instrumentation = self.instrumentation
+                if self._capture is not None:
+                    self._capture.attach(conn)
+                conn.events.line_received += self._on_line_received
                 self._set_connection_state(ConnectionState.CONNECTING)
-                conn.open()
             else:
                 logger.info('Hub disconnected')
                 self._connection = NullConnection()
                 self._set_connection_state(ConnectionState.DISCONNECTED)
+        self._storage.invalidate() # possibly another hub
+        try:
+            old.close()
+        except Exception as ex:
+            logger.exception('closing %s failed: %s', old.name, ex)
+        self._fail_pending_requests(ConnectionChangedError('hub connection changed'))
+        if conn is None: return
+
+        try:
+            conn.open()
         except Exception as ex:
             logger.exception('connection change failed: %s', ex)
-            self._connection.events.line_received -= self._on_line_received
-            self._connection = NullConnection()
-            self._set_connection_state(ConnectionState.DISCONNECTED)
+            with self._connection_lock:
+                if self._connection is conn:
+                    conn.events.line_received -= self._on_line_received
+                    self._connection = NullConnection()
+                    self._set_connection_state(ConnectionState.DISCONNECTED)
+            return
+        with self._connection_lock:
+            superseded = self._connection is not conn
+        if superseded:
+            conn.close() # another change was made while this one was opening
 
     def send_line(self, line):
         """Send one line of text to the hub.  
@@ -110,30 +299,105 @@ class HubClient(object):
         letters = string.ascii_letters + string.digits + '_'
         return ''.join(random.choice(letters) for _ in range(length))    
 
-    def send_message(self, name:str, params = {}):
-        """Send a message and return the response.
+    def send_request(self, name:str, params = {}) -> Future:
+        """Send a message without waiting; return a Future that resolves to the response.
+
+        Any number of requests may be outstanding at once; responses are matched by message
+        id and may arrive in any order.  The Future raises HubError (a ConnectionError) if the
+        hub reports an error, or ConnectionChangedError if the connection changes before the response
+        arrives.  Cancelling the Future abandons the request; a late response is ignored.
         """
+        future = Future()
         if self.state != ConnectionState.TELEMETRY:
             logger.warn('ignoring send request in state %s', self.state)
-            return
+            future.set_result(None)
+            return future
+
+        with self._pending_lock:
+            id = self._gen_message_id()
+            while id in self._pending_requests:
+                id = self._gen_message_id()
+            self._pending_requests[id] = future
+        future.add_done_callback(lambda f: self._forget_request(id) if f.cancelled() else None)
+        if name in STORAGE_METHODS:
+            # again once done: a storage status fetched meanwhile may predate the change
+            self._storage.invalidate()
+            future.add_done_callback(lambda f: self._storage.invalidate())
 
-        id = self._gen_message_id()
         msg = {'m':name, 'p': params, 'i': id}
         msg_string = json.dumps(msg)
-        self.send_line(msg_string)
-        while True:
-            resp = self._response_queue.get()
-            if resp['i'] == id: 
-                if 'r' in resp: 
-                    return resp['r']
-                if 'e' in resp: 
-                    error = json.loads(base64.b64decode(resp['e']).decode(LINE_ENCODING))
-                else:
-                    error = 'unrecognized response message: %s' % resp
-                raise ConnectionError(error)
-            else:
-                logger.warn('ignored response: ', resp)
-                
+        try:
+            self.send_line(msg_string)
+        except Exception:
+            with self._pending_lock:
+                self._pending_requests.pop(id, None)
+            raise
+        return future
+
+    def _forget_request(self, id):
+        with self._pending_lock:
+            self._pending_requests.pop(id, None)
+
+    def send_message(self, name:str, params = {}, timeout = None, retries = 0):
+        """Send a message and return the response.
+
+        timeout: seconds to wait for the response, in total over all attempts; None waits forever
+        retries: number of times to resend if the response is lost (timeout) or the connection
+            changes; each attempt gets an equal share of the remaining time.  Only allowed for
+            IDEMPOTENT_METHODS.
+
+        Raises TimeoutError if no response arrives in time, and ConnectionError as send_request.
+        """
+        if retries and name not in IDEMPOTENT_METHODS:
+            raise ValueError('cannot retry non-idempotent method %s' % name)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        attempts = retries + 1
+        for attempt in range(attempts):
+            attempt_timeout = None if deadline is None else max(0, deadline - time.monotonic()) / (attempts - attempt)
+            if attempt > 0 and not self.wait_for_telemetry(attempt_timeout):
+                continue
+            future = self.send_request(name, params)
+            try:
+                return future.result(attempt_timeout)
+            except concurrent.futures.TimeoutError:
+                future.cancel()
+                self.instrumentation.count('rpc_timeouts')
+                logger.warn('no response to %s within %.2f seconds (attempt %d of %d)', name, attempt_timeout, attempt + 1, attempts)
+            except ConnectionChangedError:
+                if attempt == attempts - 1: raise
+                logger.info('connection changed during %s; retrying', name)
+        raise TimeoutError('no response to %s within %s seconds' % (name, timeout))
+
+    def _resolve_request(self, resp):
+        """Complete the pending request matching the response message id."""
+        with self._pending_lock:
+            future = self._pending_requests.pop(resp['i'], None)
+        if future is None:
+            logger.warn('ignored response: %s', resp)
+            return
+        if not future.set_running_or_notify_cancel():
+            return # abandoned by the caller
+
+        if 'r' in resp:
+            future.set_result(resp['r'])
+            return
+        if 'e' in resp:
+            try:
+                error = json.loads(base64.b64decode(resp['e']).decode(LINE_ENCODING))
+            except Exception:
+                error = resp['e']
+        else:
+            error = 'unrecognized response message: %s' % resp
+        future.set_exception(HubError(error))
+
+    def _fail_pending_requests(self, ex):
+        with self._pending_lock:
+            pending = self._pending_requests
+            self._pending_requests = {}
+        for future in pending.values():
+            if future.set_running_or_notify_cancel():
+                future.set_exception(ex)
+
     def send_response(self, id: str, response = None):
         """Send a response.
         """
@@ -156,34 +420,100 @@ class HubClient(object):
     def _process_line_connecting(self, line):
         """Process data received during state CONNECTING."""
         if len(line) > 0 and line[0] == '{':
+            self._last_telemetry_ns = time.perf_counter_ns()
             self._set_connection_state(ConnectionState.TELEMETRY)
+            self._record_failover_gap()
         else:
             logger.info('CONNECTING: %s', line)
 
+    def _record_failover_gap(self):
+        if self._gap_start_ns is None: return
+        gap = time.perf_counter_ns() - self._gap_start_ns
+        self._gap_start_ns = None
+        self.last_failover_gap = gap / 1e9
+        self.instrumentation.histogram('failover_gap').record(gap)
+        logger.info('telemetry resumed on %s after %.1f ms', self._connection.name, gap / 1e6)
+
     def _process_line_telemetry(self, line):
-        begin = line.find('{')
-        if begin >=0:
-            try:
-                message = json.loads(line[begin:])
-                self.process_message(message)
-            except json.JSONDecodeError:
-                logger.warn('failed to decode JSON message: %s', line) 
+        start = time.perf_counter_ns()
+        self._last_telemetry_ns = start
+        try:
+            message = self._decoder.decode(line)
+        except json.JSONDecodeError:
+            self.instrumentation.count('decode_failures')
+            logger.warn('failed to decode JSON message: %s', line) 
+            return
+        if self.instrumentation.enabled:
+            self.instrumentation.record('decode', start)
+        if message is not None:
+            self.process_message(message)
         else:
+            self.instrumentation.count('non_json_lines')
             logger.info('received non-JSON: %s', line)
 
     def process_message(self, message):
         timestamp = datetime.datetime.now()
         if 'm' in message:
-            self.events.telemetry_update(timestamp, message)
+            if message['m'] == 1:
+                # here on the reader thread, so that it is ordered with the responses whose
+                # completion invalidates the cache; the dispatch thread may run behind
+                self.update_storage_status(message['p'])
+            # the reactor thread serves every connection and must not wait for subscribers
+            self._dispatcher.put(timestamp, message, block=not comm.Reactor.on_reactor_thread())
             return
         elif 'i' in message:
-            self._response_queue.put(message)
+            self._resolve_request(message)
             return
 
+        self.instrumentation.count('unhandled_messages')
         logger.warn('unhandled message: %s', message)
 
-    def get_storage_status(self):
-        return self.send_message('get_storage_status')
+    def subscribe_telemetry(self, handler, coalesce_types = STATUS_MESSAGE_TYPES) -> CoalescingSubscriber:
+        """Subscribe a (possibly slow) handler to telemetry, delivering only the newest status frames.
+
+        The handler is called as handler(timestamp, message) on its own thread.  Pending
+        messages of the types in coalesce_types are replaced by newer ones; all other
+        messages are delivered in full.  Returns the subscriber; pass it to
+        unsubscribe_telemetry to stop delivery.
+        """
+        subscriber = CoalescingSubscriber(handler, coalesce_types)
+        self.events.telemetry_update += subscriber.put
+        return subscriber
+
+    def unsubscribe_telemetry(self, subscriber : CoalescingSubscriber):
+        self.events.telemetry_update -= subscriber.put
+        subscriber.stop()
+
+    def _dispatch_telemetry(self, timestamp, message):
+        self.instrumentation.fire('telemetry_update', self.events.telemetry_update, timestamp, message)
+
+    def storage_status(self, timeout = None, retries = 0, refresh = False) -> StorageStatus:
+        """The hub's program storage status.
+
+        The status is cached until the storage changes: through our own uploads, moves and
+        removals (STORAGE_METHODS), a storage report from the hub (see update_storage_status),
+        or a connection change.  Only a cache miss, or refresh, costs a round-trip.
+        timeout and retries are as for send_message.  Returns None if not connected.
+        """
+        status = None if refresh else self._storage.get()
+        if status is not None:
+            return status
+        generation = self._storage.generation
+        info = self.send_message('get_storage_status', {}, timeout, retries)
+        if info is None: return None
+        return self._storage.put(info, generation)
+
+    def get_storage_status(self, timeout = None, retries = 0):
+        """The storage status as sent by the hub (a dict); cached, see storage_status."""
+        status = self.storage_status(timeout, retries)
+        return status.raw if status is not None else None
+
+    def update_storage_status(self, info):
+        """Record a storage status report from the hub (m:1; done by process_message).  Anything unrecognized just invalidates the cache."""
+        if isinstance(info, dict) and 'slots' in info and 'storage' in info:
+            self._storage.put(info)
+        else:
+            self._storage.invalidate()
 
     def program_execute(self, slot):
         return self.send_message('program_execute', {'slotid': slot}) 
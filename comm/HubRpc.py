@@ -0,0 +1,18 @@
+# Names shared by HubClient and clients of the hub daemon, kept apart from HubClient so
+# that tools attached to the daemon can use them without importing the hub client stack.
+
+IDEMPOTENT_METHODS = ('get_storage_status', 'get_hub_info')
+"""Methods that only read hub state, and so may safely be sent again if the response is lost."""
+
+STORAGE_METHODS = ('start_write_program', 'write_package', 'move_project', 'remove_project')
+"""Methods that change the hub's program storage, and so invalidate the cached storage status."""
+
+
+class ConnectionChangedError(ConnectionError):
+    """The connection changed (or was reopened) before a response arrived."""
+    pass
+
+
+class HubError(ConnectionError):
+    """The hub answered a request with an error."""
+    pass
@@ -0,0 +1,92 @@
+import logging
+import time
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+CR = 13 # Carriage Return
+
+# Longest partial line retained while waiting for its terminating CR
+default_max_line_length = 64 * 1024
+
+
+class LineFramer(object):
+    """Incrementally split a byte stream into CR-terminated lines.
+
+    Data is appended to a single reusable buffer and scanned only from the end of the
+    previously-scanned data, so the cost of framing is linear in the number of bytes
+    received, however the stream is chunked.  Every complete line in a chunk is returned
+    at once.
+
+    A partial line longer than max_line_length is discarded (with a warning), which
+    bounds the buffer size if the hub sends garbage without line terminators.
+
+    If an Instrumentation is given, framing time and byte/line counts are recorded.
+    """
+
+    def __init__(self, max_line_length = default_max_line_length, instrumentation = None) -> None:
+        self.max_line_length = max_line_length
+        """Maximum number of bytes held for an incomplete line."""
+
+        self.instrumentation = instrumentation
+
+        self._buffer = bytearray()
+        self._scan_from = 0
+
+        self.discarded_bytes = 0
+        """Count of bytes dropped due to overlong partial lines."""
+
+    @property
+    def pending(self):
+        """Number of bytes buffered that do not yet form a complete line."""
+        return len(self._buffer)
+
+    def reset(self):
+        """Discard any buffered partial line."""
+        self._buffer.clear()
+        self._scan_from = 0
+
+    def feed(self, data):
+        """Append received bytes and return the list of complete lines (decoded str, CR removed)."""
+        instrumentation = self.instrumentation
+        if instrumentation is None or not instrumentation.enabled:
+            return self._feed(data)
+        start = time.perf_counter_ns()
+        lines = self._feed(data)
+        instrumentation.record('framing', start)
+        instrumentation.count('bytes', len(data))
+        instrumentation.count('lines', len(lines))
+        return lines
+
+    def _feed(self, data):
+        buffer = self._buffer
+        buffer += data
+
+        pos = buffer.find(CR, self._scan_from)
+        if pos < 0:
+            # Common case for small reads: no line completed yet
+            self._scan_from = len(buffer)
+            if self._scan_from > self.max_line_length:
+                self._discard_partial_line()
+            return []
+
+        lines = []
+        start = 0
+        while pos >= 0:
+            lines.append(buffer[start:pos].decode(LINE_ENCODING, errors='replace'))
+            start = pos + 1
+            pos = buffer.find(CR, start)
+
+        # Compact once per feed so the buffer holds only the partial line;
+        # the partial line has been scanned already and need not be searched again.
+        del buffer[:start]
+        self._scan_from = len(buffer)
+        if self._scan_from > self.max_line_length:
+            self._discard_partial_line()
+        return lines
+
+    def _discard_partial_line(self):
+        logger.warn('discarding %d bytes of partial line exceeding %d bytes', len(self._buffer), self.max_line_length)
+        self.discarded_bytes += len(self._buffer)
+        self.reset()
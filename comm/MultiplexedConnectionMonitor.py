@@ -1,9 +1,10 @@
 from comm.ConnectionMonitor import ConnectionMonitor
+from comm.BluetoothConnection import BluetoothConnection
 from comm.BluetoothConnectionMonitor import BluetoothConnectionMonitor
 from comm.UsbConnectionMonitor import UsbConnectionMonitor
-from comm.SerialConnection import SerialConnection
 import logging
-from serial.tools import list_ports
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
@@ -12,16 +13,53 @@ class MultiplexedConnectionMonitor(ConnectionMonitor):
     """Monitors both the USB bus and BlueTooth for connection to the hub.
 
     If both are available, the USB device is preferred.
+
+    With hot_standby, a Bluetooth connection is opened and kept open while USB is in
+    use, whenever the hub is in Bluetooth range.  When USB is removed, the already-open
+    link is handed over at once rather than waiting for the next Bluetooth scan and
+    connect.  HubClient reports the resulting telemetry gap (see HubClient.stats()).
+
+    With race_startup, all candidate links are opened at once when monitoring starts:
+    Bluetooth immediately (without waiting for the first scan) and USB as soon as the
+    device is found.  The first link to deliver a telemetry frame is adopted and the
+    others are closed.  If none does within race_timeout seconds, the open link is
+    adopted anyway (USB preferred).  Thereafter the monitor behaves as usual, so USB
+    still takes over if it appears later.
     """
-    def __init__(self, bt_address, bt_port):
+    def __init__(self, bt_address, bt_port, serial_options = {}, hot_standby = False, race_startup = False, bt_scan_options = {},
+                 race_timeout = 10):
         super().__init__('Multiplexed', None)
-        self._usb_monitor = UsbConnectionMonitor()
+        self.hot_standby = hot_standby
+        """Keep a Bluetooth link open while USB is active, for fast failover."""
+
+        self.race_startup = race_startup
+        """At start, open USB and Bluetooth together and adopt the first to send telemetry."""
+
+        self.race_timeout = race_timeout
+        """Seconds to wait for a telemetry frame before ending the startup race."""
+
+        self._racing = False
+        self._candidates = []
+        self._race_lock = threading.Lock()
+        self._race_timer = None
+        self._race_start = None
+
+        self._bt_address = bt_address
+        self._bt_port = bt_port
+        self._standby = None
+        self._standby_opening = False
+        self._standby_lines = 0
+        self._standby_lock = threading.Lock()
+
+        self._usb_monitor = UsbConnectionMonitor(**serial_options)
         self._usb_monitor.events.connection_changed += self._on_usb_connection_changed
-        self._bt_monitor = BluetoothConnectionMonitor(bt_address, bt_port)
+        self._bt_monitor = BluetoothConnectionMonitor(bt_address, bt_port, link_open=self._is_bt_link_open, **bt_scan_options)
         self._bt_monitor.events.connection_changed += self._on_bt_connection_changed
 
     def start(self):
         is_scan_active = True
+        if self.race_startup:
+            self._begin_race()
         self._usb_monitor.start()
         self._bt_monitor.start()
 
@@ -29,20 +67,176 @@ class MultiplexedConnectionMonitor(ConnectionMonitor):
         is_scan_active = False
         self._usb_monitor.stop()
         self._bt_monitor.stop()
+        self._close_standby()
+        self._end_race(None)
 
     def _on_usb_connection_changed(self, conn):
+        if self._racing:
+            if conn is not None:
+                self._add_candidate(conn)
+            return
         if conn == self.connection: return
 
+        if conn is None and isinstance(self.connection, BluetoothConnection) and self.connection.is_open:
+            return # on a working Bluetooth link already (e.g. the startup race winner)
         if conn is None:
             # fallback to BlueTooth, which may well also be None
-            self.notify_change(self._bt_monitor.connection)
+            standby = self._take_standby()
+            if standby is not None:
+                logger.info('failover to hot-standby Bluetooth link (%d lines received while on standby)', self._standby_lines)
+                self.notify_change(standby)
+            else:
+                self.notify_change(self._bt_monitor.connection)
+                if self._bt_monitor.connection is None:
+                    self._bt_monitor.wake() # look for the hub over Bluetooth now
         else:
             # switch to USB
             self.notify_change(conn)
+            self._open_standby()
 
     def _on_bt_connection_changed(self, conn):
+        if self._racing: return # the race opens its own Bluetooth link
         if conn == self.connection: return
+        if conn is not None and isinstance(self.connection, BluetoothConnection) and self.connection.is_open:
+            return # already on a working Bluetooth link (from the race or hot standby)
+
+        if conn is None:
+            self._close_standby()
+            if isinstance(self.connection, BluetoothConnection):
+                # lost the Bluetooth link in use: fall back to USB, which may well also be None
+                self.notify_change(self._usb_monitor.connection)
+            return
 
         # if currently using USB, ignore this update; else accept
         if self._usb_monitor.connection is None:
             self.notify_change(conn)
+        else:
+            self._open_standby()
+
+    def _is_bt_link_open(self):
+        """Whether a Bluetooth link of ours is open: the race winner or former standby in use, or the standby."""
+        conn = self.connection
+        if isinstance(conn, BluetoothConnection) and conn.is_open: return True
+        standby = self._standby
+        return standby is not None and standby.is_open
+
+    def _open_standby(self):
+        """Open a standby Bluetooth link if enabled, the hub is in range, and there is none.
+
+        The link is opened on a thread of its own, as a Bluetooth connect blocks and this
+        may be called on the reactor thread (from a udev event).
+        """
+        if not self.hot_standby or self._bt_monitor.connection is None: return
+        with self._standby_lock:
+            if self._standby_opening: return
+            if self._standby is not None and self._standby.is_open: return
+            self._standby_opening = True
+        thread = threading.Thread(target=self._open_standby_work, name='HotStandbyConnect')
+        thread.daemon = True
+        thread.start()
+
+    def _open_standby_work(self):
+        # A fresh connection: a connection closed by HubClient may not be reused
+        conn = BluetoothConnection(self._bt_address, self._bt_port)
+        conn.events.line_received += self._on_standby_line
+        self._standby_lines = 0
+        try:
+            conn.open()
+        except Exception as ex:
+            logger.warn('cannot open hot-standby Bluetooth link: %s', ex)
+            with self._standby_lock:
+                self._standby_opening = False
+            return
+        with self._standby_lock:
+            self._standby_opening = False
+            wanted = self._usb_monitor.connection is not None and self._standby is None
+            if wanted:
+                self._standby = conn
+        if not wanted:
+            # USB went away (and Bluetooth was adopted some other way) while connecting
+            conn.events.line_received -= self._on_standby_line
+            conn.close()
+            return
+        logger.info('hot-standby Bluetooth link open to %s', self._bt_address)
+
+    def _take_standby(self):
+        """Detach and return the standby link if it is still open; else None."""
+        with self._standby_lock:
+            (conn, self._standby) = (self._standby, None)
+        if conn is None: return None
+        conn.events.line_received -= self._on_standby_line
+        if not conn.is_open:
+            logger.info('hot-standby Bluetooth link was lost')
+            return None
+        return conn
+
+    def _close_standby(self):
+        conn = self._take_standby()
+        if conn is not None:
+            conn.close()
+
+    def _on_standby_line(self, line):
+        self._standby_lines += 1
+
+    def _begin_race(self):
+        self._racing = True
+        self._race_start = time.monotonic()
+        self._race_timer = threading.Timer(self.race_timeout, self._on_race_timeout)
+        self._race_timer.daemon = True
+        self._race_timer.start()
+        if self._bt_address is not None:
+            self._add_candidate(BluetoothConnection(self._bt_address, self._bt_port))
+
+    def _add_candidate(self, conn):
+        """Open conn on its own thread (a Bluetooth connect blocks) and watch for telemetry."""
+        def on_line(line):
+            if line.startswith('{'):
+                self._end_race(conn)
+        with self._race_lock:
+            if not self._racing: return
+            self._candidates.append((conn, on_line))
+        conn.events.line_received += on_line
+        thread = threading.Thread(target=self._open_candidate, args=(conn,), name='ConnectRace-' + conn.name)
+        thread.daemon = True
+        thread.start()
+
+    def _open_candidate(self, conn):
+        logger.info('startup race: opening %s', conn.name)
+        try:
+            conn.open()
+        except Exception as ex:
+            logger.info('startup race: %s failed to open: %s', conn.name, ex)
+            return
+        if not self._racing and conn is not self.connection:
+            conn.close() # lost the race while connecting
+
+    def _on_race_timeout(self):
+        with self._race_lock:
+            open_candidates = [conn for (conn, _) in self._candidates if conn.is_open]
+        # prefer USB
+        open_candidates.sort(key=lambda conn: isinstance(conn, BluetoothConnection))
+        logger.warn('startup race: no telemetry after %s seconds', self.race_timeout)
+        self._end_race(open_candidates[0] if open_candidates else None)
+
+    def _end_race(self, winner):
+        """Stop racing: adopt winner (may be None) and close the other candidates."""
+        with self._race_lock:
+            if not self._racing: return
+            self._racing = False
+            (candidates, self._candidates) = (self._candidates, [])
+        self._race_timer.cancel()
+        losers = []
+        for (conn, on_line) in candidates:
+            conn.events.line_received -= on_line
+            if conn is not winner and conn.is_open:
+                losers.append(conn)
+            if conn is not winner and conn is self._usb_monitor.connection:
+                # the USB link stays available for fallback, but not this closed connection
+                self._usb_monitor.renew()
+        # Close off this thread (possibly the reactor); a still-connecting loser is closed by its opener
+        thread = threading.Thread(target=lambda: [conn.close() for conn in losers], name='ConnectRaceClose')
+        thread.daemon = True
+        thread.start()
+        if winner is None: return
+        logger.info('startup race: adopted %s after %.0f ms', winner.name, 1000 * (time.monotonic() - self._race_start))
+        self.notify_change(winner)
@@ -0,0 +1,143 @@
+from collections import deque
+import logging
+import os
+import selectors
+import socket
+import threading
+
+
+logger = logging.getLogger(__name__)
+
+
+class Reactor(object):
+    """Single I/O thread that watches many file descriptors (epoll on Linux).
+
+    Connections and connection monitors register a file descriptor with add_reader();
+    the callback is invoked on the reactor thread whenever the file is readable.
+    Callbacks must not block: they should read what is available and return.
+
+    Registration may be done from any thread.  remove_reader() waits until the
+    reactor has dropped the descriptor, so the caller may close it immediately after.
+    Register integer descriptors rather than file objects, so that removal works even
+    if the object has already been closed.
+    """
+
+    def __init__(self) -> None:
+        self._selector = selectors.DefaultSelector()
+        (self._wakeup_read, self._wakeup_write) = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self._wakeup_write.setblocking(False)
+        self._selector.register(self._wakeup_read, selectors.EVENT_READ, self._drain_wakeup)
+
+        self._calls = deque()
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    @property
+    def is_reactor_thread(self):
+        return threading.current_thread() is self._thread
+
+    def start(self):
+        """Start the reactor thread, if not already running."""
+        with self._start_lock:
+            if self._thread is not None: return
+            self._thread = threading.Thread(target=self._run, name='IoReactor')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def call_soon(self, fn, *args):
+        """Run fn(*args) on the reactor thread."""
+        self._calls.append((fn, args))
+        try:
+            self._wakeup_write.send(b'\0')
+        except BlockingIOError:
+            pass # reactor already has a wakeup pending
+
+    def add_reader(self, fileobj, callback):
+        """Invoke callback() on the reactor thread whenever fileobj is readable."""
+        self.start()
+        if self.is_reactor_thread:
+            self._selector.register(fileobj, selectors.EVENT_READ, callback)
+        else:
+            self._call_and_wait(self._selector.register, fileobj, selectors.EVENT_READ, callback)
+
+    def remove_reader(self, fileobj):
+        """Stop watching fileobj.  Returns once the reactor no longer references it."""
+        if self._thread is None: return
+        if self.is_reactor_thread:
+            self._unregister(fileobj)
+        else:
+            self._call_and_wait(self._unregister, fileobj)
+
+    def _unregister(self, fileobj):
+        try:
+            self._selector.unregister(fileobj)
+        except (KeyError, ValueError, OSError):
+            pass # not registered, or already closed
+
+    def _call_and_wait(self, fn, *args):
+        done = threading.Event()
+        result = []
+
+        def call():
+            try:
+                fn(*args)
+            except Exception as ex:
+                result.append(ex)
+            finally:
+                done.set()
+
+        self.call_soon(call)
+        done.wait()
+        if result:
+            raise result[0]
+
+    def _drain_wakeup(self):
+        try:
+            while self._wakeup_read.recv(4096): pass
+        except BlockingIOError:
+            pass
+
+    def _run(self):
+        logger.info('I/O reactor started')
+        while True:
+            try:
+                events = self._selector.select()
+            except InterruptedError:
+                continue
+            for (key, mask) in events:
+                try:
+                    key.data()
+                except Exception as ex:
+                    logger.exception('reactor callback failed; removing %s: %s', key.fileobj, ex)
+                    self._unregister(key.fileobj)
+            while self._calls:
+                (fn, args) = self._calls.popleft()
+                try:
+                    fn(*args)
+                except Exception as ex:
+                    logger.exception('reactor call failed: %s', ex)
+
+
+_shared_reactor = None
+_shared_reactor_lock = threading.Lock()
+
+enabled = os.name == 'posix'
+"""Whether connections should use the shared reactor.  Not supported on Windows, where
+serial ports cannot be polled; there each connection uses its own reader thread."""
+
+
+def on_reactor_thread():
+    """True if called on the shared reactor's thread, where callers must not block."""
+    reactor = _shared_reactor
+    return reactor is not None and reactor.is_reactor_thread
+
+
+def shared_reactor():
+    """The process-wide Reactor, or None if reactor I/O is disabled."""
+    global _shared_reactor
+    if not enabled: return None
+    with _shared_reactor_lock:
+        if _shared_reactor is None:
+            _shared_reactor = Reactor()
+        return _shared_reactor
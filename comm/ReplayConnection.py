@@ -0,0 +1,78 @@
+import logging
+import threading
+import time
+
+from comm.Capture import RECEIVED, read_capture
+from comm.Connection import Connection
+
+
+logger = logging.getLogger(__name__)
+
+
+class ReplayConnection(Connection):
+    """Connection that replays the received lines of a capture file (see comm.Capture).
+
+    Can be used with DirectConnectionMonitor to run HubClient/HubMonitor without a hub:
+        cm = DirectConnectionMonitor(ReplayConnection('session.cap', speed=10))
+
+    Arguments:
+        filename : str
+            capture file to replay
+        speed : float
+            playback rate relative to the recording (1 = real time, 10 = ten times
+            faster); 0 or None replays as fast as possible
+    """
+
+    def __init__(self, filename, speed = 1.0):
+        super().__init__()
+        self.filename = filename
+        self.speed = speed
+        self._records = [(ns, line) for (ns, direction, line) in read_capture(filename) if direction == RECEIVED]
+        self._is_active = False
+
+        self.finished = threading.Event()
+        """Set when replay has finished or the connection was closed."""
+
+    @property
+    def name(self): return 'replay:' + self.filename
+
+    @property
+    def line_count(self):
+        """Number of received lines in the capture."""
+        return len(self._records)
+
+    def open(self):
+        self._is_active = True
+        self.finished.clear()
+        self._replay_thread = threading.Thread(target=self._replay_loop, name='ReplayConnection')
+        self._replay_thread.daemon = True
+        self._replay_thread.start()
+
+    def close(self):
+        self._is_active = False
+
+    def is_finished(self):
+        return self.finished.is_set()
+
+    def write(self, line : bytearray):
+        logger.debug('SEND (replay, discarded): %s', line)
+        self.events.line_sent(line)
+
+    def _replay_loop(self):
+        logger.info('begin replay of %d lines from %s at speed %s', len(self._records), self.filename, self.speed)
+        try:
+            paced = bool(self.speed)
+            start = time.monotonic_ns()
+            first_ns = self._records[0][0] if self._records else 0
+            for (ns, line) in self._records:
+                if not self._is_active: break
+                if paced:
+                    delay = ((ns - first_ns) / self.speed - (time.monotonic_ns() - start)) / 1e9
+                    if delay > 0:
+                        time.sleep(delay)
+                self.events.line_received(line)
+        except Exception as ex:
+            logger.exception('replay loop exception: %s', ex)
+        finally:
+            self.finished.set()
+        logger.info('end replay')
@@ -1,23 +1,34 @@
 import logging
 import threading
+import time
 
 import serial
 from serial.serialutil import SerialException
 
 from comm.Connection import Connection
+from comm.LineFramer import LineFramer
+import comm.Reactor
 
 
 logger = logging.getLogger(__name__)
 
 LINE_ENCODING = 'utf-8'
-CR = 13 # Carriage Return
 
 
 class SerialConnection(Connection):
     """Serial port communication with the lego hub.
+
+    Where supported, the port is read by the shared I/O reactor (see comm.Reactor);
+    otherwise the connection starts its own reader thread.
+
+    Reads block until data arrives (no polling), then drain up to read_size bytes per
+    system call.  read_latency trades latency for fewer, larger reads: after the first
+    byte of a burst arrives, the reader thread waits read_latency seconds for the rest
+    of the burst before draining it.  The default of 0 delivers each burst as soon as
+    it is seen.
     """
 
-    def __init__(self, port):
+    def __init__(self, port, read_size = 4096, read_latency = 0.0):
         """Create a connection.
 
         The port may optionally be specified.  Otherwise, set the port property.
@@ -26,47 +37,108 @@ class SerialConnection(Connection):
         super().__init__()
         self._serial = serial.Serial()
         self._serial.port = port
+        self._reactor = None
+        self._fd = None
+
+        self.read_size = read_size
+        """Maximum bytes requested per read."""
+
+        self.read_latency = read_latency
+        """Seconds to let a burst accumulate before draining it (reader thread only)."""
+
+        self.read_timeout = 0.5
+        """Seconds a blocking read waits before the reader thread re-checks for close."""
 
     @property
     def name(self):
         return self._serial.port
 
+    @property
+    def is_open(self):
+        return self._serial.is_open
+
     def open(self):
-        """Open the connection for use.
+        """Open the connection for use.  Does nothing if already open.
         """
+        if self._serial.is_open: return
+        self._reactor = comm.Reactor.shared_reactor()
+        if self._reactor is not None:
+            self._serial.timeout = 0 # reads return what is available
+        else:
+            self._serial.timeout = self.read_timeout
         self._serial.open()
-        self._start_monitor_loop()
+        if self._reactor is not None:
+            self._start_reactor_reads()
+        else:
+            self._start_monitor_loop()
 
     def close(self):
         """Shut down the connection."""
+        if self._fd is not None:
+            self._reactor.remove_reader(self._fd)
+            self._fd = None
+            logger.info('end reactor reads on device %s', self.name)
+        else:
+            self._serial.cancel_read() # wake the reader thread
         self._serial.close()
 
     def write(self, line : bytearray):
         """Send a line of text to the hub.  A CR will be appended before sending."""
         logger.debug('SEND: %s', line)
+        self.events.line_sent(line)
         data = (line + '\r').encode(LINE_ENCODING)
         written = self._serial.write(data)
         if written != len(data):
             logger.warn('wrote %d of %d bytes for line "%s"', written, len(data), line)
         
+    def _start_reactor_reads(self):
+        logger.info('begin reactor reads on device %s', self.name)
+        self._lines_to_log = 10
+        self._framer = LineFramer(instrumentation=self.instrumentation)
+        self._fd = self._serial.fileno()
+        self._reactor.add_reader(self._fd, self._on_readable)
+
+    def _on_readable(self):
+        """Called on the reactor thread when the port has data."""
+        try:
+            data = self._serial.read(self.read_size)
+            for line in self._framer.feed(data):
+                self.events.line_received(line)
+                if self._lines_to_log > 0:
+                    logger.debug('RECV: %s', line)
+                    self._lines_to_log -= 1
+        except (SerialException, OSError):
+            self.close() # expected when the device disconnects or powers off
+        except Exception as ex:
+            logger.exception('reactor read exception: %s', ex)
+            self.close()
+
     def _start_monitor_loop(self):
         self._monitor_thread = threading.Thread(target=self._monitor_loop, name='HubConnectionMonitor')
         self._monitor_thread.daemon = True
         self._monitor_thread.start()
 
+    def _read_chunk(self):
+        """Block until data arrives (or read_timeout), then return up to read_size bytes."""
+        data = self._serial.read(1)
+        if not data: return data
+        if self.read_latency > 0:
+            time.sleep(self.read_latency)
+        count = self._serial.in_waiting
+        if count:
+            data += self._serial.read(min(count, self.read_size - 1))
+        return data
+
     def _monitor_loop(self):
         try:
             logger.info('begin monitoring loop on device %s', self.name)
             
             lines_to_log = 10
-            buffer = bytearray()
+            framer = LineFramer(instrumentation=self.instrumentation)
             while self._serial.is_open:
-                count = self._serial.in_waiting
-                buffer = buffer + self._serial.read(count if count else 1)
-                pos = buffer.find(CR)
-                if pos >= 0:
-                    line = buffer[:pos].decode(LINE_ENCODING)
-                    buffer = buffer[pos+1:]
+                data = self._read_chunk()
+                if not data: continue
+                for line in framer.feed(data):
                     self.events.line_received(line)
                     if lines_to_log > 0:
                         logger.debug('RECV: %s', line)
@@ -74,7 +146,8 @@ class SerialConnection(Connection):
         except SerialException:
             pass # expected when the device disconnects or powers off
         except Exception as ex:
-            logger.exception('monitor loop exception: %s', ex)
+            if self._serial.is_open:
+                logger.exception('monitor loop exception: %s', ex)
         finally:
             self.close()
         logger.info('end monitoring loop')
@@ -0,0 +1,71 @@
+import json
+import logging
+
+
+logger = logging.getLogger(__name__)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# Prefixes of the high-rate, fixed-shape status frames sent by the hub
+FAST_PATH_PREFIXES = ('{"m":0,', '{"m":2,')
+
+
+def _make_scanner_loads():
+    """Return a loads() function that calls the precompiled JSON scanner directly.
+
+    This skips the argument handling and whitespace matching that json.loads performs
+    on every call; the line must consist of exactly one JSON value.
+    """
+    scan_once = json.JSONDecoder().scan_once
+
+    def loads(line):
+        try:
+            (value, end) = scan_once(line, 0)
+        except StopIteration as err:
+            raise json.JSONDecodeError('Expecting value', line, err.value) from None
+        if end != len(line):
+            raise json.JSONDecodeError('Extra data', line, end)
+        return value
+
+    return loads
+
+
+class TelemetryDecoder(object):
+    """Decode lines of hub telemetry into message dicts.
+
+    Lines carrying the m:0 and m:2 status frames are decoded with a fast backend:
+    orjson if installed, otherwise the precompiled json scanner.  Any other line, or a
+    status line that fails the fast path, goes through the generic path -- locate the
+    first '{' and decode with json.loads.
+    """
+
+    def __init__(self, use_orjson = True) -> None:
+        if use_orjson and orjson is not None:
+            self.backend = 'orjson'
+            self._fast_loads = orjson.loads
+        else:
+            self.backend = 'scanner'
+            self._fast_loads = _make_scanner_loads()
+
+    def decode(self, line : str):
+        """Decode one stripped line.
+
+        Returns the message, or None if the line does not contain JSON.
+        Raises json.JSONDecodeError if the JSON is malformed.
+        """
+        if line.startswith(FAST_PATH_PREFIXES):
+            try:
+                return self._fast_loads(line)
+            except ValueError:
+                pass # fall through to generic path
+        return self.decode_generic(line)
+
+    @staticmethod
+    def decode_generic(line : str):
+        begin = line.find('{')
+        if begin < 0: return None
+        return json.loads(line[begin:])
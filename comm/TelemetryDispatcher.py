@@ -0,0 +1,133 @@
+from collections import deque
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('block', 'drop_oldest', 'coalesce')
+
+# Message types that carry complete hub state; a newer frame supersedes an older one
+STATUS_MESSAGE_TYPES = (0, 2)
+
+
+class TelemetryDispatcher(object):
+    """Hands telemetry messages from the connection reader thread to subscribers.
+
+    Messages are placed in a bounded queue and delivered, in order, by a dedicated
+    dispatch thread so that slow subscribers (file logging, UI) do not stall reads.
+    When the queue is full, the overflow policy decides what happens:
+        block       -- the reader waits for space
+        drop_oldest -- the oldest queued status frame (m:0 / m:2) is discarded
+        coalesce    -- an older queued status frame is discarded, preferring one of
+                       the same type
+    Other messages (console output, which the hub waits to have acknowledged, program
+    run state, buttons) are never discarded: if no status frame is queued, the reader
+    waits for space whatever the policy.
+
+    A reader that must not wait (the I/O reactor thread) puts with block=False: a full
+    queue then discards a status frame as under drop_oldest, even with policy block, and
+    with no status frame queued it grows beyond maxsize.
+
+    A maxsize of 0 disables the queue: messages are delivered synchronously on the
+    calling thread.
+
+    Arguments:
+        handler : function
+            called as handler(timestamp, message) for each message
+        instrumentation : Instrumentation
+            optional; records queue wait ('dispatch_wait') and handler time ('dispatch')
+    """
+
+    def __init__(self, handler, maxsize = 256, overflow = 'block', instrumentation = None) -> None:
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError("overflow policy must be one of %s: %s" % (OVERFLOW_POLICIES, overflow))
+        self._handler = handler
+        self._instrumentation = instrumentation
+        self.maxsize = maxsize
+        self.overflow = overflow
+
+        self._queue = deque()
+        self._condition = threading.Condition()
+        self._dispatched = 0
+        self._dropped = 0
+        self._max_depth = 0
+        self._thread = None
+
+        if maxsize > 0:
+            self._thread = threading.Thread(target=self._dispatch_loop, name='TelemetryDispatch')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def counters(self):
+        """Snapshot of dispatch counters: depth, max_depth, dispatched, dropped."""
+        with self._condition:
+            return {
+                'depth': len(self._queue),
+                'max_depth': self._max_depth,
+                'dispatched': self._dispatched,
+                'dropped': self._dropped,
+            }
+
+    def put(self, timestamp, message, block = True):
+        """Queue a message for delivery; with block False, never wait (see class doc)."""
+        if self.maxsize <= 0:
+            start = time.perf_counter_ns()
+            self._handler(timestamp, message)
+            self._dispatched += 1
+            if self._instrumentation is not None and self._instrumentation.enabled:
+                self._instrumentation.record('dispatch', start)
+            return
+
+        with self._condition:
+            while len(self._queue) >= self.maxsize:
+                if self.overflow == 'drop_oldest' and self._discard_status_frame(None):
+                    self._dropped += 1
+                elif self.overflow == 'coalesce' and self._discard_status_frame(message):
+                    self._dropped += 1
+                elif not block:
+                    if self.overflow == 'block' and self._discard_status_frame(None):
+                        self._dropped += 1
+                    break
+                else:
+                    self._condition.wait()
+            self._queue.append((timestamp, message, time.perf_counter_ns()))
+            self._max_depth = max(self._max_depth, len(self._queue))
+            self._condition.notify_all()
+
+    def _discard_status_frame(self, message):
+        """Remove one queued status frame: the oldest of the same type as message, if any, else the oldest."""
+        msgtype = message.get('m') if message is not None else None
+        fallback = None
+        for item in self._queue:
+            queued_type = item[1].get('m')
+            if queued_type not in STATUS_MESSAGE_TYPES: continue
+            if queued_type == msgtype:
+                self._queue.remove(item)
+                return True
+            if fallback is None:
+                fallback = item
+        if fallback is None:
+            return False
+        self._queue.remove(fallback)
+        return True
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                while not self._queue:
+                    self._condition.wait()
+                (timestamp, message, enqueued) = self._queue.popleft()
+                self._condition.notify_all()
+            start = time.perf_counter_ns()
+            try:
+                self._handler(timestamp, message)
+            except Exception as ex:
+                logger.exception('telemetry subscriber exception: %s', ex)
+            instrumentation = self._instrumentation
+            if instrumentation is not None and instrumentation.enabled:
+                instrumentation.histogram('dispatch_wait').record(start - enqueued)
+                instrumentation.record('dispatch', start)
+            with self._condition:
+                self._dispatched += 1
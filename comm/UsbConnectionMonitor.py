@@ -6,6 +6,7 @@ import serial
 from serial.tools import list_ports
 
 from comm.ConnectionMonitor import ConnectionMonitor
+import comm.Reactor
 
 logger = logging.getLogger(__name__)
 
@@ -32,12 +33,18 @@ class UsbConnectionMonitor(ConnectionMonitor):
 
     Call method start() to initiate USB monitoring.    
     This version has hard-coded port selection criteria.
+    On Linux, the udev monitor is watched by the shared I/O reactor (see comm.Reactor)
+    when enabled, rather than by a thread of its own.
     The selected set of ports is available using method ports(),
     and, when changed, event ports_changed is raised.
     """
-    def __init__(self):
+    def __init__(self, **serial_options):
+        """serial_options: keyword arguments for each SerialConnection created (e.g. read_size)."""
         super(UsbConnectionMonitor, self).__init__("USB", self._thread_work)
         self._devname = None
+        self._serial_options = serial_options
+        self._reactor = None
+        self._udev_monitor = None
 
     def is_online(self):
         return self._devname != None
@@ -58,14 +65,69 @@ class UsbConnectionMonitor(ConnectionMonitor):
             logger.warn('will not overwrite existing port %s, ignoring add of port %s', self._devname, devname)
             return
         self._devname = devname
-        ser = SerialConnection(devname)
+        ser = SerialConnection(devname, **self._serial_options)
         self.notify_change(ser)
 
+    def renew(self):
+        """Replace the current connection, once closed, by a fresh one for the same device.
+
+        connection_changed is not raised.  Returns the new connection, or None if no device.
+        """
+        if self._devname is None: return None
+        self._connection = SerialConnection(self._devname, **self._serial_options)
+        return self._connection
+
     def _remove_port(self, devname):
         if self._devname != devname: return
         self._devname = None
         self.notify_change(None)        
 
+    def start(self):
+        import platform
+        self._reactor = comm.Reactor.shared_reactor()
+        if self._reactor is None or platform.system() != 'Linux':
+            super().start()
+            return
+
+        logger.info('Starting %s autoconnect detection on I/O reactor', self.name)
+        self._is_scan_active = True
+        self._initial_scan()
+        self._udev_monitor = self._make_udev_monitor()
+        self._reactor.add_reader(self._udev_monitor.fileno(), self._on_udev_readable)
+
+    def stop(self):
+        super().stop()
+        if self._udev_monitor is not None:
+            self._reactor.remove_reader(self._udev_monitor.fileno())
+            self._udev_monitor = None
+
+    def _make_udev_monitor(self):
+        import pyudev
+        context = pyudev.Context()
+        monitor = pyudev.Monitor.from_netlink(context)
+        monitor.start()
+        monitor.filter_by('tty')
+        return monitor
+
+    def _on_udev_readable(self):
+        """Called on the reactor thread when udev has events."""
+        usb_dev = self._udev_monitor.poll(timeout=0)
+        while usb_dev is not None:
+            try:
+                self._handle_udev_event(usb_dev)
+            except Exception:
+                logger.exception('failure handling udev event')
+            usb_dev = self._udev_monitor.poll(timeout=0)
+
+    def _handle_udev_event(self, usb_dev):
+        is_lego = is_lego_device(usb_dev)
+        logger.info('autoconnect: device %s (is_lego = %s), action: %s', usb_dev.device_node, is_lego, usb_dev.action)
+        if not is_lego: return
+        if usb_dev.action == 'add':
+            self._add_port(usb_dev.properties['DEVNAME'])
+        elif usb_dev.action == 'remove':
+            self._remove_port(usb_dev.properties['DEVNAME'])
+
     def _thread_work(self):
         """Monitor devices added/removed on the USB bus."""
 
@@ -76,11 +138,7 @@ class UsbConnectionMonitor(ConnectionMonitor):
             return
         
         # For now, only continue if we are on Linux system
-        import pyudev
-        context = pyudev.Context()
-        monitor = pyudev.Monitor.from_netlink(context)
-        monitor.start()
-        monitor.filter_by('tty')
+        monitor = self._make_udev_monitor()
 
         epoll = select.epoll()
         epoll.register(monitor.fileno(), select.POLLIN)
@@ -92,11 +150,4 @@ class UsbConnectionMonitor(ConnectionMonitor):
                 continue
             for fileno, _ in events:
                 if fileno == monitor.fileno():
-                    usb_dev = monitor.poll()
-                    is_lego = is_lego_device(usb_dev)
-                    logger.info('autoconnect: device %s (is_lego = %s), action: %s', usb_dev.device_node, is_lego, usb_dev.action)
-                    if not is_lego_device(usb_dev): continue
-                    if usb_dev.action == 'add':
-                        self._add_port(usb_dev.properties['DEVNAME'])
-                    elif usb_dev.action == 'remove':
-                        self._remove_port(usb_dev.properties['DEVNAME'])
+                    self._handle_udev_event(monitor.poll())
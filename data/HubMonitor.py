@@ -1,10 +1,12 @@
 import base64
 import logging
+import time
 
 from events import Events
 from comm import HubClient
 from data.HubStatus import HubStatus
 from data.NullHubLogger import NullHubLogger
+from data.ProgramRunState import ProgramRunState
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +17,7 @@ class HubMonitor(object):
     def __init__(self, hub_client: HubClient) -> None:
         self._client: HubClient = hub_client
         self._status = HubStatus()
-        self._execution_status = (None, None)
+        self._run_state = ProgramRunState()
 
         hub_client.events.telemetry_update += self._on_telemetry_update
 
@@ -34,7 +36,24 @@ class HubMonitor(object):
     def connection_state(self): return self._client.state
 
     @property
-    def execution_status(self): return self._execution_status
+    def execution_status(self): return self._run_state.status
+
+    def program_end_future(self, project_id = None):
+        """Future resolved when the program next stops; see ProgramRunState."""
+        return self._run_state.program_end_future(project_id)
+
+    def wait_for_program_end(self, project_id = None, timeout = None) -> bool:
+        """Wait until the program is reported stopped; see ProgramRunState."""
+        return self._run_state.wait_for_program_end(project_id, timeout)
+
+    def _log_telemetry(self, timestamp, message):
+        instrumentation = self._client.instrumentation
+        if not instrumentation.enabled:
+            self.logger.telemetry_update(timestamp, message, self.status)
+            return
+        start = time.perf_counter_ns()
+        self.logger.telemetry_update(timestamp, message, self.status)
+        instrumentation.record('logger', start)
 
     def _on_telemetry_update(self, timestamp, message):
         message_recognized = True
@@ -42,13 +61,12 @@ class HubMonitor(object):
             msgtype = message['m']
             if msgtype == 0:
                 self._status.set_status0(message['p'])
-                self.logger.telemetry_update(timestamp, message, self.status)
+                self._log_telemetry(timestamp, message)
             elif msgtype == 1:
-                # TODO handle m:1 (storage status)
-                pass
+                pass # storage status; cached by HubClient as it is received
             elif msgtype == 2:
                 self._status.set_status2(message['p'])
-                self.logger.telemetry_update(timestamp, message, self.status)
+                self._log_telemetry(timestamp, message)
             elif msgtype == 3:
                 (button_id, millis) = message['p']
                 if millis == 0:
@@ -60,32 +78,33 @@ class HubMonitor(object):
             elif msgtype == 12:
                 (program_id, is_running) = message['p']
                 logger.info('Program ID %s changed run state to %s', program_id, is_running)
-                self._execution_status = (program_id, is_running)
+                self._run_state.update(program_id, is_running)
                 self.logger.program_runstatus_update(timestamp, program_id, is_running)
             elif msgtype == 'userProgram.print':
                 output = base64.b64decode(message['p']['value']).decode(LINE_ENCODING)
                 self._client.send_response(message['i'])
                 logger.info('Program output: %s', output.strip())
                 self._client.send_response(message['i'])
-                self.events.console_print(output)
+                self._client.instrumentation.fire('console_print', self.events.console_print, output)
             elif msgtype == 'user_program_error':
                 params = message['p']
                 logger.info('Program error output: %s', params[0:3])
                 err =  base64.b64decode(params[3]).decode(LINE_ENCODING)
                 logger.info('Program error message: %s', err.strip())
-                self.events.console_print("***ERROR\n" + err)
+                self._client.instrumentation.fire('console_print', self.events.console_print, "***ERROR\n" + err)
             elif msgtype == 'runtime_error':
                 params = message['p']
                 logger.info('Runtime error output: %s', params[0:3])
                 err =  base64.b64decode(params[3]).decode(LINE_ENCODING)
                 logger.info('Program error message: %s', err.strip())
-                self.events.console_print("***ERROR (Runtime)\n" + err)
+                self._client.instrumentation.fire('console_print', self.events.console_print, "***ERROR (Runtime)\n" + err)
             else:
                 message_recognized = False
         else:
             message_recognized = False
 
         if not message_recognized:
+            self._client.instrumentation.count('unhandled_messages')
             logger.warn('unhandled message: %s', message)
 
             # TODO handle message types:
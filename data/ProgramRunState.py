@@ -0,0 +1,52 @@
+from concurrent.futures import Future
+import threading
+
+
+class ProgramRunState(object):
+    """Run state of the user program on the hub, as reported by m:12 messages.
+
+    Transitions can be waited for rather than polled.  To wait for a program that is
+    about to be started, take program_end_future() *before* starting it: a short
+    program may finish before the start request has even been answered.
+    """
+
+    def __init__(self) -> None:
+        self._status = (None, None)
+        self._condition = threading.Condition()
+        self._end_futures = []
+        """Futures waiting for a program to stop: list of (project_id or None, Future)."""
+
+    @property
+    def status(self):
+        """(project_id, is_running) from the last report; (None, None) before the first."""
+        return self._status
+
+    def update(self, project_id, is_running):
+        """Record a run-state report and wake anything waiting for it."""
+        with self._condition:
+            self._status = (project_id, is_running)
+            self._condition.notify_all()
+            if is_running: return
+            ended = [future for (id, future) in self._end_futures if id is None or id == project_id]
+            self._end_futures = [(id, future) for (id, future) in self._end_futures if future not in ended]
+        for future in ended:
+            if future.set_running_or_notify_cancel():
+                future.set_result(project_id)
+
+    def program_end_future(self, project_id = None) -> Future:
+        """Future resolved with the project id when the hub next reports that the program
+        (any program, if project_id is None) has stopped.  May be cancelled."""
+        future = Future()
+        with self._condition:
+            self._end_futures.append((project_id, future))
+        return future
+
+    def wait_for_program_end(self, project_id = None, timeout = None) -> bool:
+        """Wait until the last reported state of the program (any program, if project_id
+        is None) is stopped.  Returns False if timeout seconds pass first."""
+        def is_stopped():
+            (id, is_running) = self._status
+            if project_id is None: return not is_running
+            return id == project_id and is_running is False
+        with self._condition:
+            return self._condition.wait_for(is_stopped, timeout)
@@ -0,0 +1,87 @@
+import base64
+import threading
+
+
+class SlotInfo(object):
+    """A program stored in one slot, from the hub's storage status."""
+
+    def __init__(self, slot : int, info : dict) -> None:
+        self.slot = slot
+        self.raw = info
+        """The slot's entry in get_storage_status, as sent by the hub."""
+        self.name = info['name'] if 'name' in info else ''
+        """Program name as stored: base64 encoded, for programs uploaded by the LEGO app or run_command."""
+        self.size = info['size'] if 'size' in info else 0
+        self.modified = info['modified'] if 'modified' in info else 0
+        """Time of upload, in milliseconds since the epoch."""
+        self.created = info['created'] if 'created' in info else 0
+        self.project_id = info['project_id'] if 'project_id' in info else None
+        self.type = info['type'] if 'type' in info else None
+        """'python' or 'scratch'."""
+
+    @property
+    def decoded_name(self) -> str:
+        try:
+            return base64.b64decode(self.name).decode('utf-8')
+        except Exception:
+            return self.name
+
+
+class StorageStatus(object):
+    """The hub's program storage, as reported by get_storage_status (or an m:1 message)."""
+
+    def __init__(self, info : dict) -> None:
+        self.raw = info
+        """The storage status as sent by the hub; shared with other users of the cache, so do not modify."""
+        self.slots = {int(slot): SlotInfo(int(slot), slot_info) for (slot, slot_info) in info['slots'].items()}
+        """Occupied slots: slot number -> SlotInfo."""
+        storage = info['storage']
+        self.free = storage['free'] if 'free' in storage else None
+        self.total = storage['total'] if 'total' in storage else None
+        self.unit = storage['unit'] if 'unit' in storage else ''
+        """Unit of free and total, e.g. 'kb'."""
+
+    def slot(self, slot : int) -> SlotInfo:
+        """The program in a slot, or None if the slot is empty."""
+        return self.slots.get(slot)
+
+
+class StorageStatusCache(object):
+    """Last known StorageStatus of a hub.
+
+    The cache is invalidated when the storage may have changed: when we change it
+    (upload, move, remove) and when the connection changes.  A fetch that was started
+    before an invalidation is not stored, since its result may predate the change;
+    take generation before sending get_storage_status and pass it to put().
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._status = None
+        self.generation = 0
+        """Incremented on every invalidation and update."""
+        self.hits = 0
+        self.misses = 0
+
+    def get(self) -> StorageStatus:
+        """The cached status, or None if it must be fetched."""
+        with self._lock:
+            if self._status is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return self._status
+
+    def put(self, info : dict, generation = None) -> StorageStatus:
+        """Store a storage status fetched at generation (None: current, e.g. from telemetry); returns it as a StorageStatus."""
+        status = StorageStatus(info)
+        with self._lock:
+            if generation is None or generation == self.generation:
+                self._status = status
+                self.generation += 1
+        return status
+
+    def invalidate(self):
+        with self._lock:
+            self._status = None
+            self.generation += 1
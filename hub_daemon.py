@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+
+# Keep a connection to the hub open and share it with other tools over a Unix socket.
+#
+# While the daemon runs, run_command.py attaches to it rather than connecting to the
+# hub itself, so each command costs about one RPC round-trip.
+
+import argparse
+import logging
+import os
+import time
+
+from comm.BrokerClient import default_socket_path
+from comm.HubBroker import HubBroker
+from comm.HubClient import HubClient
+from data.HubMonitor import HubMonitor
+from utils.setup import setup_logging
+
+logger = logging.getLogger("App")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Share the hub connection with other tools over a Unix socket')
+    parser.add_argument('--socket', default=default_socket_path(), help='socket path (default: %(default)s)')
+    args = parser.parse_args()
+
+    setup_logging(os.path.dirname(__file__) + "/logs/hub_daemon.log")
+
+    client = HubClient()
+    monitor = HubMonitor(client)
+    client.start()
+    broker = HubBroker(client, monitor, args.socket)
+    broker.start()
+    print('Hub daemon listening on %s (Ctrl-C to stop)' % args.socket)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    broker.stop()
+    print('Handled %d requests' % broker.requests_handled)
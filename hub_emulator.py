@@ -0,0 +1,40 @@
+#!/usr/bin/env python3
+
+# Run a simulated hub on a pseudo-terminal, for load testing without hardware.
+#
+# Configure the toolkit to use the printed device, e.g. in lego_hub.yaml:
+#   connection: serial
+#   serial:
+#     device: '/dev/pts/5'
+
+import argparse
+import logging
+import os
+import time
+
+from utils.HubEmulator import HubEmulator
+from utils.setup import setup_logging
+
+logger = logging.getLogger("App")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Simulated LEGO hub on a pseudo-terminal')
+    parser.add_argument('--rate', type=float, default=10, help='m:0 telemetry frames per second')
+    parser.add_argument('--latency', type=float, default=0.0, help='RPC response latency in seconds')
+    parser.add_argument('--blocksize', type=int, default=512, help='upload block size reported by start_write_program')
+    parser.add_argument('--program-duration', type=float, default=1.0, help='seconds a started program runs')
+    args = parser.parse_args()
+
+    setup_logging(os.path.dirname(__file__) + "/logs/hub_emulator.log")
+
+    emulator = HubEmulator(args.rate, args.latency, args.blocksize, args.program_duration)
+    emulator.start()
+    print('Hub emulator running on %s (Ctrl-C to stop)' % emulator.device_name)
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    emulator.stop()
+    print('Sent %d telemetry frames, handled %d requests' % (emulator.frames_sent, emulator.requests_handled))
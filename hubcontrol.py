@@ -1,6 +1,5 @@
 #! /usr/bin/python3
 
-import base64
 from data.ProgramHubLogger import ProgramHubLogger
 from datetime import datetime
 import logging
@@ -20,6 +19,7 @@ from PyQt5.QtWidgets import QApplication, QPushButton, QWidget
 from comm.HubClient import ConnectionState, HubClient
 from data.HubMonitor import HubMonitor
 from data.HubStatus import HubStatus
+from data.StorageStatus import StorageStatus
 from ui.DeviceStatusWidget import DeviceStatusWidget
 from utils.setup import setup_logging
 
@@ -29,28 +29,12 @@ log_filename = os.path.dirname(__file__) + "/logs/hubcontrol.log"
 setup_logging(log_filename)
 
 
-def list_programs(info):
-    storage = info['storage']
-    slots = info['slots']
+def list_programs(storage : StorageStatus):
     print("%4s %-40s %6s %-20s %-12s %-10s" % ("Slot", "Decoded Name", "Size",  "Last Modified", "Project_id", "Type"))
-    for i in range(20):
-        if str(i) in slots:
-            sl = slots[str(i)]
-            modified = datetime.utcfromtimestamp(sl['modified']/1000).strftime('%Y-%m-%d %H:%M:%S')
-            try:
-                decoded_name = base64.b64decode(sl['name']).decode('utf-8')
-            except:
-                decoded_name = sl['name']
-            try:
-                project = sl['project_id']
-            except:
-                project = " "
-            try:
-                type = sl['type']
-            except:
-                type = " "
-            print("%4s %-40s %5db %-20s %-12s %-10s" % (i, decoded_name, sl['size'], modified, project, type))
-    print(("Storage free %s%s of total %s%s" % (storage['free'], storage['unit'], storage['total'], storage['unit'])))
+    for (i, sl) in sorted(storage.slots.items()):
+        modified = datetime.utcfromtimestamp(sl.modified/1000).strftime('%Y-%m-%d %H:%M:%S')
+        print("%4s %-40s %5db %-20s %-12s %-10s" % (i, sl.decoded_name, sl.size, modified, sl.project_id or " ", sl.type or " "))
+    print(("Storage free %s%s of total %s%s" % (storage.free, storage.unit, storage.total, storage.unit)))
     
 
 class ConsoleWidget(QTextEdit):
@@ -70,11 +54,16 @@ class ConsoleWidget(QTextEdit):
     def append_line(self, text): self.append(text + '\n')
 
 class ProgramWidget(QWidget):
+    program_finished = pyqtSignal(str)
+    """Raised on the GUI thread when a program started with Run stops."""
+
     def __init__(self, hub_client : HubClient, hub_monitor : HubMonitor, *args, **kwargs):
         super().__init__(*args, **kwargs)
 
         self._client = hub_client
         self._monitor = hub_monitor
+        self._program_end = None
+        self.program_finished.connect(self._on_program_finished)
         self._executing_program_label = QLabel()
         self._slot_spinbox = QSpinBox()
         self._run_button = QPushButton('Run')
@@ -100,15 +89,33 @@ class ProgramWidget(QWidget):
 
     def refresh(self):
         is_connected = self._client.state == ConnectionState.TELEMETRY
+        if not is_connected and self._program_end is not None:
+            self._program_end.cancel() # the end will not be reported
+            self._program_end = None
         self._executing_program_label.setText(self._monitor.execution_status[0])
-        self._run_button.setEnabled(is_connected)
+        self._run_button.setEnabled(is_connected and self._program_end is None)
         self._stop_button.setEnabled(is_connected)
 
     def run_program(self):
         slot = self._slot_spinbox.value()
-        r = self._client.program_execute(slot)
+        self._program_end = self._monitor.program_end_future()
+        self._program_end.add_done_callback(
+            lambda f: None if f.cancelled() else self.program_finished.emit(f.result()))
+        self._run_button.setEnabled(False)
+        try:
+            r = self._client.program_execute(slot)
+        except Exception:
+            self._program_end.cancel()
+            self._program_end = None
+            raise
         logger.debug('Program execute returns: %s', r)
 
+    def _on_program_finished(self, project_id):
+        logger.info('Program %s finished', project_id)
+        self._program_end = None
+        self._executing_program_label.setText(project_id)
+        self._run_button.setEnabled(self._client.state == ConnectionState.TELEMETRY)
+
     def stop_program(self):
         r = self._client.program_terminate()
         logger.debug('Program terminate returns: %s', r)
@@ -173,7 +180,7 @@ class MainWindow(QMainWindow):
         self.program_widget.refresh()
 
     def list_programs(self):
-        storage_status = self._client.get_storage_status()
+        storage_status = self._client.storage_status()
         if storage_status is not None:
             list_programs(storage_status)
 
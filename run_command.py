@@ -3,28 +3,179 @@
 # Run a command on the hub.
 # Guts were lifted from spikeprime-tools/spiketools/spikejsonrpcapispike.py
 
+# Imports are kept light, and the hub client stack is imported only when connecting
+# directly, so that --help and commands sent via the hub daemon start quickly.
+# benchmarks/bench_import_time.py checks this.
+
 import base64
 import os
 import argparse
-from tqdm import tqdm
 import time
 import logging
+from collections import deque
+import concurrent.futures
+import contextlib
+import re
 from datetime import datetime
-from comm.HubClient import ConnectionState, HubClient
-from data.HubMonitor import HubMonitor
+from comm.BrokerClient import BrokerClient, default_socket_path
+from comm.HubRpc import IDEMPOTENT_METHODS, HubError
+from data.StorageStatus import StorageStatus
+from utils.CompileCache import CompileCache
 from utils.setup import setup_logging
-import mpy_cross
 from pathlib import Path
 
 logger = logging.getLogger("App")
 
+MAX_SLOT = 19
+
+
+class PipelinedBlockRejected(HubError):
+  """The hub rejected a write_package block sent while others were still in flight."""
+
+
+class UploadWindow:
+  """Number of write_package messages to keep outstanding during an upload.
+
+  The window grows by one while the round-trip time stays near the minimum observed,
+  and halves when round-trips lengthen (i.e. the hub or link is queueing).
+  """
+
+  def __init__(self, max_size: int):
+    self.max_size = max(1, max_size)
+    self.size = min(2, self.max_size)
+    self.min_rtt = None
+
+  def record_rtt(self, rtt: float):
+    if self.min_rtt is None or rtt < self.min_rtt:
+      self.min_rtt = rtt
+    if rtt <= 1.5 * self.min_rtt:
+      self.size = min(self.size + 1, self.max_size)
+    else:
+      self.size = max(self.size // 2, 1)
+
+
+def mpy_cross_version() -> str:
+  from importlib import metadata
+  try:
+    return metadata.version('mpy-cross')
+  except metadata.PackageNotFoundError:
+    return 'unknown'
+
+
+def compile_program(src_file: str, out_file: str = None, opt: int = 0, cache: CompileCache = None) -> str:
+  """Compile a python file with mpy-cross; returns the path of the .mpy file, or None on failure.
+
+  With a cache, the compiler is skipped if the same source was compiled before with the
+  same mpy-cross version and options, and the cached file is returned (out_file is ignored).
+  """
+  import mpy_cross
+  options = ['-municode']
+  if opt != 0 and 0 < opt <= 3:
+    options.append(f'-O{opt}')
+
+  key = None
+  if cache is not None:
+    key = cache.key(Path(src_file).read_bytes(), mpy_cross_version(), options)
+    cached = cache.lookup(key)
+    if cached:
+      logger.info(f'Compile cache hit: {src_file}')
+      return cached
+    out_file = cache.temp_path()
+  elif not out_file:
+    out_file = Path(src_file).with_suffix('.mpy')
+
+  cmd = options + [str(src_file), '-o', str(out_file)]
+  try:
+    logger.info(f'Executing mpy_cross with args: {" ".join(cmd)}')
+    res = mpy_cross.run(*cmd)
+    if res.wait() != 0:
+      raise RuntimeError(f'mpy_cross exit status {res.returncode}')
+  except Exception:
+    logger.warning(f'Failed to compile: {src_file}')
+    if key is not None:
+      os.remove(out_file)
+    return None
+  logger.info(f'Successfully compiled: {src_file}')
+  return cache.store(key, out_file) if key is not None else out_file
+
+
+def batch_items(specs, first_slot: int = 0, occupied = ()) -> list:
+  """(file, slot, name) tuples from command-line specs FILE:SLOT[:NAME] or DIRECTORY.
+
+  The .py and .mpy files in a directory go to consecutive free slots from first_slot, in
+  file name order: slots given explicitly and the `occupied` slots (those holding a program
+  on the hub) are skipped.  Of foo.py and foo.mpy in the same directory, only foo.py is taken.
+  """
+  explicit = []
+  pending = []
+  for spec in specs:
+    if os.path.isdir(spec):
+      files = [p for p in Path(spec).iterdir() if p.suffix.lower() in ('.py', '.mpy')]
+      sources = {p.with_suffix('') for p in files if p.suffix.lower() == '.py'}
+      pending.extend(sorted(str(p) for p in files if p.suffix.lower() == '.py' or p.with_suffix('') not in sources))
+      continue
+    m = re.match(r'^(.*?):(\d+)(?::(.*))?$', spec)
+    if not m:
+      raise ValueError(f'{spec}: expected FILE:SLOT[:NAME] or a directory')
+    slot = int(m.group(2))
+    if slot > MAX_SLOT or slot in (s for (_, s, _) in explicit):
+      raise ValueError(f'{spec}: slot {slot} is out of range or given twice')
+    explicit.append((m.group(1), slot, m.group(3)))
+  used = {slot for (_, slot, _) in explicit} | set(occupied)
+  items = list(explicit)
+  slot = first_slot
+  for file in pending:
+    while slot in used: slot += 1
+    if slot > MAX_SLOT:
+      raise ValueError(f'no free slot for {file}')
+    items.append((file, slot, None))
+    used.add(slot)
+  return items
+
+
+def compile_programs(files, opt: int = 0, cache: CompileCache = None, jobs: int = None, out_dir: str = None) -> dict:
+  """Compile several files in parallel; returns a dict mapping each file to its .mpy path (None on failure).
+
+  Each compile runs mpy-cross in its own process, so a thread pool is enough to keep
+  `jobs` compilers busy.  Without a cache, the .mpy files are written to out_dir if given,
+  else next to their sources.
+  """
+  out_files = [os.path.join(out_dir, '%d_%s.mpy' % (i, Path(f).stem)) if out_dir else None for (i, f) in enumerate(files)]
+  with concurrent.futures.ThreadPoolExecutor(jobs or os.cpu_count()) as pool:
+    return dict(zip(files, pool.map(lambda f, out: compile_program(f, out, opt, cache), files, out_files)))
+
 
 class RPC:
-  def __init__(self):
-    self._client = HubClient()
-    self._hm = HubMonitor(self._client)
+  def __init__(self, timeout: float = None, retries: int = 0, socket_path: str = None, direct: bool = False,
+               compile_cache: CompileCache = None):
+    """timeout: seconds allowed for the hub to connect and for each call (None waits forever)
+    retries: resend attempts for idempotent queries (e.g. get_storage_status) whose response is lost
+    socket_path: hub daemon socket to attach to (see hub_daemon.py); if no daemon is
+      listening, or direct is set, connect to the hub directly
+    compile_cache: cache for program_compile, or None to always run the compiler
+    """
+    self.timeout = timeout
+    self.retries = retries
+    self.compile_cache = compile_cache
+    self._client = None if direct else self._attach_daemon(socket_path)
+    if self._client is not None:
+      self._hm = self._client  # BrokerClient mirrors the HubMonitor state used here
+    else:
+      from comm.HubClient import HubClient
+      from data.HubMonitor import HubMonitor
+      self._client = HubClient()
+      self._hm = HubMonitor(self._client)
+      self._client.start()
     self._hm.events.console_print += self._console_print
-    self._client.start()
+
+  def _attach_daemon(self, socket_path):
+    broker = BrokerClient(socket_path)
+    try:
+      broker.connect()
+    except OSError:
+      logger.info('no hub daemon at %s; connecting directly', broker.path)
+      return None
+    return broker
     
   def _console_print(self, msg):
     print(msg, end='')
@@ -34,37 +185,55 @@ class RPC:
     letters = string.ascii_letters + string.digits + '_'
     return ''.join(random.choice(letters) for _ in range(length))  
 
+  def _wait_for_telemetry(self):
+    if self._client.wait_for_telemetry(0):
+      return
+    logger.info('waiting for hub to connect')
+    if not self._client.wait_for_telemetry(self.timeout):
+      raise TimeoutError(f'hub did not connect within {self.timeout} seconds')
+
   def send_message(self, name, params = {}):
-    while rpc._client.state is not ConnectionState.TELEMETRY:
-      logger.info('waiting for hub to connect')
-      time.sleep(0.2)
-    return self._client.send_message(name, params)
+    self._wait_for_telemetry()
+    retries = self.retries if name in IDEMPOTENT_METHODS else 0
+    return self._client.send_message(name, params, timeout=self.timeout, retries=retries)
+
+  def send_request(self, name, params = {}):
+    """Send a message without waiting for the response; returns a Future."""
+    self._wait_for_telemetry()
+    return self._client.send_request(name, params)
+
+  def wait_response(self, future, name):
+    """Wait for the response to a send_request() Future, within the call timeout."""
+    try:
+      return future.result(self.timeout)
+    except concurrent.futures.TimeoutError:
+      future.cancel()
+      raise TimeoutError(f'no response to {name} within {self.timeout} seconds')
 
   # Program Methods
   def program_execute(self, n: int, wait: bool = True, terminate_on_ctrl_c: bool = True):
-    info = rpc.get_storage_information()
-    if info is None:
+    storage = self.storage_status()
+    if storage is None:
       logger.error(f'Cannot get storage information from Hub')
       raise SystemExit
     
-    slots = info['slots']
-    
-    if str(n) not in slots:
+    project = storage.slot(n)
+    if project is None:
       logger.error(f'Cannot find program in slot {n}')
       return
     
-    project = slots[str(n)]
-    project_id = project['project_id']
+    project_id = project.project_id
 
+    # Armed before starting, so that the end of a short program is not missed
+    ended = self._hm.program_end_future(project_id)
     res = self.send_message('program_execute', {'slotid': n})
     
     if not wait:
+      ended.cancel()
       return res
     
     try:  
-      import time
-      while self._hm.execution_status != (project_id, False):
-        time.sleep(0.5)
+      ended.result()
     except KeyboardInterrupt:
       if terminate_on_ctrl_c and self._hm.execution_status[1]:  # take care of 'None' and 'False'
         logger.warning('Ctrl-C received, terminating program...')
@@ -80,38 +249,89 @@ class RPC:
     return self.send_message('program_terminate')
 
   def get_storage_information(self) -> dict:
-    return self.send_message('get_storage_status')
+    """The hub's storage status as sent by the hub; cached by the client until the storage changes."""
+    self._wait_for_telemetry()
+    return self._client.get_storage_status(timeout=self.timeout, retries=self.retries)
+
+  def storage_status(self) -> StorageStatus:
+    info = self.get_storage_information()
+    return StorageStatus(info) if info is not None else None
   
   def program_compile(self, src_file: str, out_file: str = None, opt: int = 0) -> str:
-    cmd = f'-municode {src_file}'
+    return compile_program(src_file, out_file, opt, self.compile_cache)
+
+  def program_write(self, file:str, name: str = None, slot: int = 0, vm: bool = False, compile: bool = False, window: int = 8,
+                    progress = None):
+    """Upload a program to the given slot.  Returns the new project id, or False on failure.
+
+    Up to `window` write_package messages are kept outstanding at once; the window adapts
+    to the observed round-trip time.  A window of 1 is plain stop-and-wait.  If the hub
+    rejects a block (other than the first) sent while others were in flight, the upload is
+    restarted in stop-and-wait mode once the responses to the blocks still in flight are in.
+    Other hub errors, e.g. from start_write_program, are raised as they are.
+    Progress is shown on a tqdm bar of its own, or on `progress` if given.
+    """
     
-    if not out_file:
-      out_file = Path(src_file).with_suffix('.mpy')
-    cmd += f' -o {out_file}'
-    if opt != 0 and 0 < opt <= 3:
-      cmd += f' -O{opt}'
-    try:
-      logger.info(f'Executing mpy_cross with args: {cmd}')
-      res = mpy_cross.run(*cmd.split())
-      res.wait()
-    except:
-      logger.warning(f'Failed to compile: {src_file}')
-      return None
-    logger.info(f'Successfully compiled: {src_file}')
-    return out_file
-
-  def program_write(self, file:str, name: str = None, slot: int = 0, vm: bool = False, compile: bool = False) -> bool:
-    
-    def _start_write_program(name, size, slot, created, modified, filename: str = '__init__.py'):
-      project_id = self._gen_random_id(12)
+    def _start_write_program(name, size, slot, created, modified, project_id, filename: str = '__init__.py'):
       type = 'scratch' if vm else 'python'
       meta = {'created': created, 'modified': modified, 'name': str(base64.b64encode(name.encode()), 'utf-8'), 
               'type': type, 'project_id': project_id}
       return self.send_message('start_write_program', {'slotid':slot, 'size': size, 'meta': meta, 'filename': filename})
 
-    def _write_package(data, transferid):
-      return self.send_message('write_package', {'data': str(base64.b64encode(data), 'utf-8'), 'transferid': transferid})
-    
+    def _write_package_request(data, transferid):
+      return self.send_request('write_package', {'data': str(base64.b64encode(data), 'utf-8'), 'transferid': transferid})
+
+    def _drain(outstanding):
+      """Wait out (or abandon, on timeout) blocks still in flight, so that they cannot mix with a new transfer."""
+      for (future, _, _) in outstanding:
+        try:
+          self.wait_response(future, 'write_package')
+        except Exception:
+          pass
+      outstanding.clear()
+
+    def _upload(f, size, window):
+      f.seek(0)
+      now = int(time.time() * 1000)
+      project_id = self._gen_random_id(12)
+      start = _start_write_program(name, size, slot, now, now, project_id, filename=dest_file)
+      bs = start['blocksize']
+      id = start['transferid']
+      window_control = UploadWindow(window)
+      outstanding = deque()
+      t_begin = time.monotonic()
+      done = 0
+      if progress is None:
+        from tqdm import tqdm
+        bar = tqdm(total=size, unit='B', unit_scale=True)
+      else:
+        bar = contextlib.nullcontext(progress)
+      with bar as pbar:
+        b = f.read(bs)
+        try:
+          while b or outstanding:
+            while b and len(outstanding) < window_control.size:
+              outstanding.append((_write_package_request(b, id), len(b), time.monotonic()))
+              b = f.read(bs)
+            in_flight = len(outstanding)
+            (future, length, sent) = outstanding.popleft()
+            try:
+              self.wait_response(future, 'write_package')
+            except HubError as ex:
+              if done == 0 or in_flight <= 1: raise
+              raise PipelinedBlockRejected(*ex.args)
+            window_control.record_rtt(time.monotonic() - sent)
+            pbar.update(length)
+            done += length
+            elapsed = time.monotonic() - t_begin
+            pbar.set_postfix(window=window_control.size, Bps='%.0f' % (done / elapsed if elapsed > 0 else 0))
+        except Exception:
+          _drain(outstanding)
+          raise
+      elapsed = time.monotonic() - t_begin
+      logger.info('Uploaded %d bytes in %.2fs (%.0f B/s, final window %d)', size, elapsed, size / elapsed if elapsed > 0 else 0, window_control.size)
+      return project_id
+
     filepath = Path(file)
 
     if not filepath.exists():
@@ -121,7 +341,7 @@ class RPC:
     is_py = filepath.suffix.lower() == '.py'
     is_mpy = filepath.suffix.lower() == '.mpy'
     
-    if args.compile:
+    if compile:
       if is_mpy:
         logger.warning(f'Skip compiling mpy file: {filepath.name}')
       else:
@@ -129,7 +349,7 @@ class RPC:
         out_file = tempfile.NamedTemporaryFile(suffix='.mpy')
         mpy_name = out_file.name
         out_file.close()
-        mpy_file = rpc.program_compile(filepath, out_file=mpy_name)
+        mpy_file = self.program_compile(filepath, out_file=mpy_name)
         if mpy_file:
           is_mpy = True
           is_py = False
@@ -146,18 +366,58 @@ class RPC:
     with open(filepath, "rb") as f:
       size = os.path.getsize(filepath)
       name = name if name else file
-      now = int(time.time() * 1000)
-      start = _start_write_program(name, size, slot, now, now, filename=dest_file)
-      bs = start['blocksize']
-      id = start['transferid']
-      with tqdm(total=size, unit='B', unit_scale=True) as pbar:
-        b = f.read(bs)
-        while b:
-          _write_package(b, id)
-          pbar.update(len(b))
-          b = f.read(bs)
-    return True
-
+      progress_start = progress.n if progress is not None else 0
+      try:
+        return _upload(f, size, window)
+      except PipelinedBlockRejected as ex:
+        logger.warning('Pipelined upload rejected by hub (%s); retrying with stop-and-wait', ex)
+        if progress is not None:
+          progress.update(progress_start - progress.n)
+        return _upload(f, size, 1)
+
+
+  def program_write_batch(self, items, vm: bool = False, compile: bool = False, window: int = 8, jobs: int = None) -> list:
+    """Upload several programs in one session, on a single progress bar.
+
+    items is a list of (file, slot, name) tuples; name may be None.  Files to compile are
+    compiled in parallel first.  A failed upload does not stop the others.  Returns a list
+    of (file, slot, bytes uploaded, project id, error): the project id is None and error
+    gives the reason if the upload failed.
+    """
+    from tqdm import tqdm
+    import tempfile
+    results = []
+    uploads = []
+    # without a cache, compile into a directory of our own rather than the source tree
+    with tempfile.TemporaryDirectory() if compile and self.compile_cache is None else contextlib.nullcontext() as out_dir:
+      compiled = {}
+      if compile:
+        compiled = compile_programs([f for (f, _, _) in items if Path(f).suffix.lower() == '.py'], 0, self.compile_cache, jobs, out_dir)
+      for (file, slot, name) in items:
+        if file in compiled:
+          if not compiled[file]:
+            results.append((file, slot, 0, None, 'compile failed'))
+            continue
+          uploads.append((file, compiled[file], slot, name if name else file))
+        elif not os.path.isfile(file):
+          results.append((file, slot, 0, None, 'no such file'))
+        else:
+          uploads.append((file, file, slot, name))
+
+      total = sum(os.path.getsize(path) for (_, path, _, _) in uploads)
+      with tqdm(total=total, unit='B', unit_scale=True) as pbar:
+        for (file, path, slot, name) in uploads:
+          pbar.set_description('%s -> %d' % (os.path.basename(file), slot))
+          try:
+            project_id = self.program_write(path, name, slot, vm=vm, window=window, progress=pbar)
+            if project_id:
+              results.append((file, slot, os.path.getsize(path), project_id, None))
+            else:
+              results.append((file, slot, 0, None, 'not a .py or .mpy file'))
+          except Exception as ex:
+            logger.error(f'Fail to write file {file}: {ex}')
+            results.append((file, slot, 0, None, '%s: %s' % (type(ex).__name__, ex)))
+    return results
 
   def move_project(self, from_slot, to_slot):
     return self.send_message('move_project', {'old_slotid': from_slot, 'new_slotid': to_slot})
@@ -188,29 +448,12 @@ class RPC:
 
 if __name__ == "__main__":
   def handle_list():
-    info = rpc.get_storage_information()
-    storage = info['storage']
-    slots = info['slots']
+    storage = rpc.storage_status()
     print("%4s %-40s %6s %-20s %-12s %-10s" % ("Slot", "Decoded Name", "Size",  "Last Modified", "Project_id", "Type"))
-    for i in range(20):
-      if str(i) in slots:
-        sl = slots[str(i)]
-        modified = datetime.utcfromtimestamp(sl['modified']/1000).strftime('%Y-%m-%d %H:%M:%S')
-        try:
-          decoded_name = base64.b64decode(sl['name']).decode('utf-8')
-        except:
-          decoded_name = sl['name']
-        try:
-          project = sl['project_id']
-        except:
-          project = " "
-        try:
-          type = sl['type']
-        except:
-          type = " "
-        # print("%2s %-40s %-40s %5db %6s %-20s %-20s %-10s" % (i, sl['name'], decoded_name, sl['size'], sl['id'], modified, project, type))
-        print("%4s %-40s %5db %-20s %-12s %-10s" % (i, decoded_name, sl['size'], modified, project, type))
-    print(("Storage free %s%s of total %s%s" % (storage['free'], storage['unit'], storage['total'], storage['unit'])))
+    for (i, sl) in sorted(storage.slots.items()):
+      modified = datetime.utcfromtimestamp(sl.modified/1000).strftime('%Y-%m-%d %H:%M:%S')
+      print("%4s %-40s %5db %-20s %-12s %-10s" % (i, sl.decoded_name, sl.size, modified, sl.project_id or " ", sl.type or " "))
+    print(("Storage free %s%s of total %s%s" % (storage.free, storage.unit, storage.total, storage.unit)))
   
   def handle_fwinfo():
     info = rpc.get_firmware_info()
@@ -218,8 +461,17 @@ if __name__ == "__main__":
     rt = '.'.join(str(x) for x in info['runtime']['version'])
     print("Firmware version: %s; Runtime version: %s" % (fw, rt))
   
+  def handle_compile():
+    results = compile_programs(args.files, args.optimize, compile_cache, args.jobs)
+    for (src, mpy) in results.items():
+      print("%-40s %s" % (src, mpy if mpy else 'FAILED'))
+    if compile_cache is not None:
+      print("Compile cache: %d hits, %d misses" % (compile_cache.hits, compile_cache.misses))
+    if not all(results.values()):
+      raise SystemExit(1)
+
   def handle_upload():
-    res = rpc.program_write(args.file, args.name, args.to_slot, vm=args.vm, compile=args.compile)
+    res = rpc.program_write(args.file, args.name, args.to_slot, vm=args.vm, compile=args.compile, window=args.window)
     if not res:
       logger.error(f'Fail to write file: {args.file}')
       return False
@@ -227,9 +479,101 @@ if __name__ == "__main__":
       rpc.program_execute(args.to_slot, wait=args.wait)
     return True
 
+  def handle_batch():
+    try:
+      occupied = ()
+      if any(os.path.isdir(spec) for spec in args.items):
+        occupied = {int(slot) for slot in rpc.get_storage_information()['slots']}
+      items = batch_items(args.items, args.first_slot, occupied)
+    except ValueError as ex:
+      parser.error(str(ex))
+    t_begin = time.monotonic()
+    results = rpc.program_write_batch(items, vm=args.vm, compile=args.compile, window=args.window, jobs=args.jobs)
+    elapsed = time.monotonic() - t_begin
+    failed = [(file, slot, error) for (file, slot, _, project_id, error) in results if project_id is None]
+    size = sum(size for (_, _, size, _, _) in results)
+    print("Uploaded %d of %d programs, %d bytes in %.1fs (%.0f B/s)" %
+          (len(results) - len(failed), len(results), size, elapsed, size / elapsed if elapsed > 0 else 0))
+    if failed:
+      print("Failed:")
+      for (file, slot, error) in sorted(failed, key=lambda r: r[1]):
+        print("%4d %-40s %s" % (slot, file, error))
+      raise SystemExit(1)
+
+  def handle_sync():
+    from utils.SlotSync import load_manifest, content_hash, plan_moves, SyncState
+    t_begin = time.monotonic()
+    manifest = load_manifest(args.manifest)
+    desired = {slot: content_hash(entry) for (slot, entry) in manifest.items()}
+    state = SyncState()
+    def stored_content():
+      slots = rpc.get_storage_information()['slots']
+      return {int(slot): state.content_of(info) for (slot, info) in slots.items()}
+    stored = stored_content()
+    keep = {slot for (slot, digest) in desired.items() if stored.get(slot) == digest}
+    unchanged = len(keep)
+    wanted = {slot: digest for (slot, digest) in desired.items() if slot not in keep}
+    (moves, placed) = plan_moves(wanted, stored, keep)
+    if args.dry_run:
+      uploads = sorted(set(wanted) - placed)
+      extra = sorted(set(stored) - set(desired)) if args.prune else []
+      for (from_slot, to_slot) in moves: print("move   %2d -> %2d" % (from_slot, to_slot))
+      for slot in uploads: print("upload %2d    %s" % (slot, manifest[slot]['file']))
+      for slot in extra: print("remove %2d (if still unused after moves)" % slot)
+      return
+
+    # The plan assumes move_project swaps the two slots, which is only known of the emulator;
+    # so make one move at a time and plan again from the storage the hub then reports.
+    moved = 0
+    while moves:
+      (from_slot, to_slot) = moves[0]
+      rpc.move_project(from_slot, to_slot)
+      moved += 1
+      stored = stored_content()
+      if stored.get(to_slot) != desired[to_slot]:
+        logger.warning(f'Moving slot {from_slot} to {to_slot} did not place the program there; uploading the rest')
+        break
+      placed = {slot for (slot, digest) in wanted.items() if stored.get(slot) == digest}
+      keep |= placed
+      wanted = {slot: digest for (slot, digest) in wanted.items() if slot not in placed}
+      (moves, _) = plan_moves(wanted, stored, keep)
+    uploads = sorted(slot for (slot, digest) in wanted.items() if stored.get(slot) != digest)
+    to_compile = [manifest[slot]['file'] for slot in uploads if manifest[slot]['compile']]
+    if to_compile and compile_cache is not None:
+      # in parallel, ahead of the uploads, which then find them in the cache
+      compile_programs(to_compile, 0, compile_cache, args.jobs)
+    uploaded = {}
+    for slot in uploads:
+      entry = manifest[slot]
+      project_id = rpc.program_write(entry['file'], entry['name'], slot, vm=entry['vm'], compile=entry['compile'], window=args.window)
+      if project_id:
+        uploaded[slot] = project_id
+      else:
+        logger.error(f'Fail to write file: {entry["file"]}')
+
+    slots = rpc.get_storage_information()['slots']
+    for (slot, project_id) in uploaded.items():
+      info = slots.get(str(slot))
+      if info is not None and info.get('project_id') == project_id:
+        state.record(desired[slot], info)
+    state.save()
+    removed = [slot for slot in sorted(int(s) for s in slots) if args.prune and slot not in desired]
+    for slot in removed:
+      rpc.remove_project(slot)
+
+    print("Sync: %d unchanged, %d moved, %d uploaded, %d removed in %.1fs" %
+          (unchanged, moved, len(uploaded), len(removed), time.monotonic() - t_begin))
+    if len(uploaded) < len(uploads):
+      raise SystemExit(1)
+
   parser = argparse.ArgumentParser(description='Tools for Spike Hub RPC protocol')
   parser.add_argument('--verbose', '-v', help='print informational messages to console', action='store_true')
-  parser.set_defaults(func=lambda: parser.print_help())
+  parser.add_argument('--timeout', type=float, default=10, help='seconds to wait for the hub to connect and for each response (0 = forever)')
+  parser.add_argument('--retries', type=int, default=2, help='resend attempts for read-only queries whose response is lost')
+  parser.add_argument('--socket', default=default_socket_path(), help='hub daemon socket (default: %(default)s)')
+  parser.add_argument('--direct', help='connect to the hub directly even if a hub daemon is running', action='store_true')
+  parser.add_argument('--no-cache', help='always run mpy-cross rather than reusing cached output', action='store_true')
+  parser.set_defaults(func=lambda: parser.print_help(), needs_hub=True)
   sub_parsers = parser.add_subparsers()
 
   list_parser = sub_parsers.add_parser('list', aliases=['ls'], help='List stored programs')
@@ -251,8 +595,33 @@ if __name__ == "__main__":
   cpprogram_parser.add_argument('--wait', '-w', help='Start and wait for program to finish', action='store_true')
   cpprogram_parser.add_argument('--vm', help='Virtualmachine-based python program', action='store_true')
   cpprogram_parser.add_argument('--compile', '-c', help='Compile python program before upload', action='store_true')
+  cpprogram_parser.add_argument('--window', type=int, default=8, help='maximum blocks in flight during upload (1 = stop-and-wait)')
   cpprogram_parser.set_defaults(func=handle_upload)
 
+  compile_parser = sub_parsers.add_parser('compile', help='Compile programs with mpy-cross into the compile cache (no hub needed)')
+  compile_parser.add_argument('files', nargs='+')
+  compile_parser.add_argument('--jobs', '-j', type=int, default=None, help='parallel compiles (default: number of CPUs)')
+  compile_parser.add_argument('--optimize', '-O', type=int, default=0, help='mpy-cross optimization level 0-3')
+  compile_parser.set_defaults(func=handle_compile, needs_hub=False)
+
+  batch_parser = sub_parsers.add_parser('batch', help='Uploads several programs over one connection')
+  batch_parser.add_argument('items', nargs='+', metavar='FILE:SLOT[:NAME] | DIR',
+                            help='program and slot (overwritten if in use), or a directory whose .py/.mpy files go to consecutive empty slots')
+  batch_parser.add_argument('--first-slot', type=int, default=0, help='first slot for programs from directories')
+  batch_parser.add_argument('--vm', help='Virtualmachine-based python programs', action='store_true')
+  batch_parser.add_argument('--compile', '-c', help='Compile python programs before upload', action='store_true')
+  batch_parser.add_argument('--jobs', '-j', type=int, default=None, help='parallel compiles (default: number of CPUs)')
+  batch_parser.add_argument('--window', type=int, default=8, help='maximum blocks in flight during upload (1 = stop-and-wait)')
+  batch_parser.set_defaults(func=handle_batch)
+
+  sync_parser = sub_parsers.add_parser('sync', help='Make the hub\'s slots match a manifest, uploading only what changed')
+  sync_parser.add_argument('manifest', help='YAML file mapping slots to programs (see README)')
+  sync_parser.add_argument('--prune', help='remove programs in slots the manifest does not list', action='store_true')
+  sync_parser.add_argument('--dry-run', '-n', help='print the plan without changing the hub', action='store_true')
+  sync_parser.add_argument('--jobs', '-j', type=int, default=None, help='parallel compiles (default: number of CPUs)')
+  sync_parser.add_argument('--window', type=int, default=8, help='maximum blocks in flight during upload (1 = stop-and-wait)')
+  sync_parser.set_defaults(func=handle_sync)
+
   rmprogram_parser = sub_parsers.add_parser('rm', help='Removes the program at a given slot')
   rmprogram_parser.add_argument('from_slot', type=int)
   rmprogram_parser.set_defaults(func=lambda: rpc.remove_project(args.from_slot))
@@ -293,5 +662,8 @@ if __name__ == "__main__":
 
   setup_logging(os.path.dirname(__file__) + "/logs/run_command.log", log_level)
 
-  rpc = RPC()
+  compile_cache = None if args.no_cache else CompileCache()
+  if args.needs_hub:
+    rpc = RPC(timeout=args.timeout or None, retries=args.retries, socket_path=args.socket, direct=args.direct,
+              compile_cache=compile_cache)
   args.func()
@@ -0,0 +1,97 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+import appdirs
+
+
+logger = logging.getLogger(__name__)
+
+
+class CompileCache(object):
+    """On-disk cache of compiler output, addressed by content.
+
+    Entries are keyed by a hash of the source text, the compiler version and the
+    compiler options, so a changed source, compiler or option never hits a stale entry.
+    The total size is bounded: after each store, the least-recently-used entries (by
+    file modification time, refreshed on every hit) are removed until the cache fits
+    in max_bytes.  Stores are atomic, so several processes may share the directory.
+
+    Arguments:
+        directory : str
+            cache location; by default a directory under the user cache directory
+        max_bytes : int
+            size limit for all entries
+        suffix : str
+            file name suffix of entries
+    """
+
+    def __init__(self, directory = None, max_bytes = 64 * 1024 * 1024, suffix = '.mpy') -> None:
+        self.directory = directory if directory is not None else os.path.join(appdirs.user_cache_dir('lego-hub-tk'), 'mpy')
+        self.max_bytes = max_bytes
+        self.suffix = suffix
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+
+    @staticmethod
+    def key(source : bytes, compiler_version : str, options) -> str:
+        """Cache key for compiling source with the given compiler version and options."""
+        h = hashlib.sha256()
+        for part in [compiler_version.encode('utf-8'), ' '.join(options).encode('utf-8'), source]:
+            h.update(len(part).to_bytes(8, 'little'))
+            h.update(part)
+        return h.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.suffix)
+
+    def lookup(self, key):
+        """Path of the cached entry for key, or None if there is none."""
+        path = self.path(key)
+        try:
+            os.utime(path) # mark as recently used
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+
+    def temp_path(self):
+        """A fresh file name in the cache directory, for the compiler to write to before store()."""
+        (fd, path) = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        return path
+
+    def store(self, key, output_path):
+        """Move a compiled file (from temp_path()) into the cache; returns the entry's path."""
+        path = self.path(key)
+        os.replace(output_path, path)
+        self.evict()
+        return path
+
+    def evict(self):
+        """Remove least-recently-used entries until the cache fits in max_bytes."""
+        with self._lock:
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(self.suffix): continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue # removed by another process
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total = sum(size for (_, size, _) in entries)
+            for (_, size, path) in sorted(entries):
+                if total <= self.max_bytes: break
+                try:
+                    os.remove(path)
+                    logger.debug('evicted %s from compile cache', path)
+                except FileNotFoundError:
+                    pass
+                total -= size
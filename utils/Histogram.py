@@ -0,0 +1,103 @@
+import threading
+
+
+class Histogram(object):
+    """Log-linear histogram of non-negative integer values (e.g. durations in ns).
+
+    In the style of HdrHistogram: each power-of-two range is split into
+    2**sub_bucket_bits linear buckets, so recorded values keep a relative precision of
+    about 1 / 2**sub_bucket_bits whatever their magnitude, in constant memory per
+    decade.  Recording is O(1).
+
+    Recording and reading are locked, since the receive pipeline records from the
+    reader, dispatch and reactor threads while stats() reads.
+    """
+
+    def __init__(self, sub_bucket_bits = 3) -> None:
+        self._bits = sub_bucket_bits
+        self._linear_limit = 2 << sub_bucket_bits
+        self._counts = {}
+        self.total = 0
+        self.max = 0
+        self._lock = threading.Lock()
+
+    def _bounds(self, index):
+        """Smallest and largest values that map to the bucket."""
+        if index < self._linear_limit:
+            return (index, index)
+        shift = (index >> self._bits) - 1
+        mantissa = index - (shift << self._bits)
+        return (mantissa << shift, ((mantissa + 1) << shift) - 1)
+
+    def record(self, value):
+        if value < self._linear_limit:
+            index = value
+        else:
+            shift = value.bit_length() - self._bits - 1
+            index = (shift << self._bits) + (value >> shift)
+        with self._lock:
+            counts = self._counts
+            counts[index] = counts.get(index, 0) + 1
+            self.total += value
+            if value > self.max:
+                self.max = value
+
+    def reset(self):
+        with self._lock:
+            self._counts = {}
+            self.total = 0
+            self.max = 0
+
+    def _state(self):
+        """Consistent copy of (counts, total, max)."""
+        with self._lock:
+            return (dict(self._counts), self.total, self.max)
+
+    @property
+    def count(self):
+        return sum(self._state()[0].values())
+
+    @property
+    def min(self):
+        """Lower bound of the smallest value recorded."""
+        counts = self._state()[0]
+        if not counts: return None
+        return self._bounds(min(counts))[0]
+
+    @property
+    def mean(self):
+        (counts, total, _) = self._state()
+        count = sum(counts.values())
+        return total / count if count else None
+
+    def percentile(self, p):
+        """Value at or below which p percent of the recorded values fall (bucket upper bound)."""
+        return self._percentile(self._state(), p)
+
+    def _percentile(self, state, p):
+        (counts, _, max_value) = state
+        count = sum(counts.values())
+        if count == 0: return None
+        threshold = count * p / 100.0
+        seen = 0
+        for index in sorted(counts):
+            seen += counts[index]
+            if seen >= threshold:
+                return min(self._bounds(index)[1], max_value)
+        return max_value
+
+    def snapshot(self):
+        """Summary statistics as a dict, all taken from the same moment."""
+        state = self._state()
+        (counts, total, max_value) = state
+        count = sum(counts.values())
+        return {
+            'count': count,
+            'min': self._bounds(min(counts))[0] if counts else None,
+            'mean': total / count if count else None,
+            'p50': self._percentile(state, 50),
+            'p90': self._percentile(state, 90),
+            'p99': self._percentile(state, 99),
+            'p999': self._percentile(state, 99.9),
+            'max': max_value if counts else None,
+        }
@@ -0,0 +1,247 @@
+import base64
+import heapq
+import json
+import logging
+import os
+import pty
+import random
+import threading
+import time
+import tty
+
+from comm.LineFramer import LineFramer
+
+
+logger = logging.getLogger(__name__)
+
+LINE_ENCODING = 'utf-8'
+
+STATUS0_TEMPLATE = [[75, [0, 0, 0, 0]], [75, [0, 0, 0, 0]], [61, [None, 0, None, None, None]], [62, [None]],
+                    [0, []], [0, []], [0, 0, 1000], [0, 0, 0], [0, 0, 0], '', 0]
+
+
+class HubEmulator(object):
+    """Simulated LEGO hub attached to a pseudo-terminal.
+
+    SerialConnection can open device_name as if it were the hub's USB serial port.
+    The emulator emits m:0 status frames at telemetry_rate (Hz) and an m:2 frame once per
+    second, and answers the JSON-RPC methods used by run_command.py after
+    response_latency seconds.  Program storage is kept in memory; changes to it are
+    reported with an m:1 message carrying the new storage status.
+
+    Arguments:
+        telemetry_rate : float
+            m:0 frames per second; 0 disables telemetry after the first frame
+        response_latency : float
+            seconds between receiving a request and sending its response
+        blocksize : int
+            block size reported by start_write_program
+        program_duration : float
+            seconds a started program "runs" before reporting it has stopped
+    """
+
+    def __init__(self, telemetry_rate = 10, response_latency = 0.0, blocksize = 512, program_duration = 1.0) -> None:
+        self.telemetry_rate = telemetry_rate
+        self.response_latency = response_latency
+        self.blocksize = blocksize
+        self.program_duration = program_duration
+
+        self.slots = {}
+        """Stored programs: slot number (str) -> slot info dict, as reported by get_storage_status."""
+        self.storage_total = 32 * 1024
+
+        self.requests_handled = 0
+        self.frames_sent = 0
+
+        self._transfers = {}
+        self._master = None
+        self._slave = None
+        self._is_active = False
+        self._write_lock = threading.Lock()
+        self._schedule = []
+        self._schedule_condition = threading.Condition()
+        self._sequence = 0
+
+    @property
+    def device_name(self):
+        """Path of the pseudo-terminal to use as the hub's serial device."""
+        return os.ttyname(self._slave)
+
+    def start(self):
+        (self._master, self._slave) = pty.openpty()
+        tty.setraw(self._slave)
+        self._is_active = True
+        for (target, name) in [(self._request_loop, 'HubEmulatorRequests'),
+                               (self._telemetry_loop, 'HubEmulatorTelemetry'),
+                               (self._send_loop, 'HubEmulatorSend')]:
+            thread = threading.Thread(target=target, name=name)
+            thread.daemon = True
+            thread.start()
+        logger.info('hub emulator listening on %s', self.device_name)
+
+    def stop(self):
+        self._is_active = False
+        with self._schedule_condition:
+            self._schedule_condition.notify()
+        os.close(self._master)
+        os.close(self._slave)
+
+    def send_line(self, line, delay = 0.0):
+        """Send a line to the connected client after delay seconds."""
+        with self._schedule_condition:
+            self._sequence += 1
+            heapq.heappush(self._schedule, (time.monotonic() + delay, self._sequence, line))
+            self._schedule_condition.notify()
+
+    def _write(self, line):
+        data = (line + '\r').encode(LINE_ENCODING)
+        with self._write_lock:
+            os.write(self._master, data)
+
+    def _send_loop(self):
+        try:
+            while self._is_active:
+                with self._schedule_condition:
+                    while self._is_active and not self._schedule:
+                        self._schedule_condition.wait()
+                    if not self._is_active: return
+                    (due, _, line) = self._schedule[0]
+                    delay = due - time.monotonic()
+                    if delay > 0:
+                        self._schedule_condition.wait(delay)
+                        continue
+                    heapq.heappop(self._schedule)
+                self._write(line)
+        except OSError:
+            pass # pty closed
+
+    def _telemetry_loop(self):
+        self._write('LEGO Hub emulator')
+        period = 1.0 / self.telemetry_rate if self.telemetry_rate > 0 else None
+        next_frame = time.monotonic()
+        next_status2 = next_frame
+        try:
+            while self._is_active:
+                now = time.monotonic()
+                if now >= next_status2:
+                    self._write(json.dumps({'m': 2, 'p': [8.3, 100, True]}, separators=(',', ':')))
+                    next_status2 = now + 1.0
+                self._write(json.dumps({'m': 0, 'p': self._status0()}, separators=(',', ':')))
+                self.frames_sent += 1
+                if period is None: return
+                next_frame += period
+                delay = next_frame - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    next_frame = time.monotonic()
+        except OSError:
+            pass # pty closed
+
+    def _status0(self):
+        status = [list(v) if isinstance(v, list) else v for v in STATUS0_TEMPLATE]
+        status[8] = [random.randint(-180, 180), random.randint(-5, 5), random.randint(-5, 5)]
+        return status
+
+    def _request_loop(self):
+        framer = LineFramer()
+        try:
+            while self._is_active:
+                data = os.read(self._master, 4096)
+                if not data: break
+                for line in framer.feed(data):
+                    self._handle_line(line)
+        except OSError:
+            pass # pty closed
+
+    def _handle_line(self, line):
+        try:
+            message = json.loads(line)
+        except json.JSONDecodeError:
+            logger.warn('emulator ignoring non-JSON input: %s', line)
+            return
+        if 'm' not in message:
+            return # response to a hub-initiated message
+
+        self.requests_handled += 1
+        handler = getattr(self, '_rpc_' + message['m'].replace('.', '_'), None)
+        params = message.get('p', {})
+        try:
+            if handler is None:
+                if not message['m'].startswith('scratch.'):
+                    raise ValueError('unsupported method: %s' % message['m'])
+                result = None
+            else:
+                result = handler(params)
+            response = {'i': message['i'], 'r': result}
+        except Exception as ex:
+            error = base64.b64encode(json.dumps({'message': str(ex)}).encode(LINE_ENCODING)).decode(LINE_ENCODING)
+            response = {'i': message['i'], 'e': error}
+        self.send_line(json.dumps(response, separators=(',', ':')), self.response_latency)
+
+    def _storage_used(self):
+        return sum(slot['size'] for slot in self.slots.values())
+
+    def _rpc_get_storage_status(self, params):
+        used = self._storage_used() // 1024
+        total = self.storage_total // 1024
+        return {
+            'storage': {'available': total - used, 'total': total, 'pct': 100.0 * used / total, 'unit': 'kb', 'free': total - used},
+            'slots': {k: dict(v) for (k, v) in self.slots.items()},
+        }
+
+    def _send_storage_status(self):
+        """Report a storage change with an m:1 message, as the hub does."""
+        self.send_line(json.dumps({'m': 1, 'p': self._rpc_get_storage_status(None)}), self.response_latency)
+
+    def _rpc_get_hub_info(self, params):
+        return {'firmware': {'version': [1, 0, 6, 34], 'checksum': 'emulator'},
+                'runtime': {'version': [2, 1, 4, 10], 'checksum': 'emulator'}}
+
+    def _rpc_start_write_program(self, params):
+        size = params['size']
+        if size + self._storage_used() > self.storage_total:
+            raise ValueError('not enough storage')
+        transferid = ''.join(random.choice('0123456789abcdef') for _ in range(8))
+        self._transfers[transferid] = {'slotid': params['slotid'], 'meta': params['meta'], 'size': size, 'data': bytearray()}
+        return {'blocksize': self.blocksize, 'transferid': transferid}
+
+    def _rpc_write_package(self, params):
+        transfer = self._transfers[params['transferid']]
+        transfer['data'] += base64.b64decode(params['data'])
+        if len(transfer['data']) >= transfer['size']:
+            del self._transfers[params['transferid']]
+            meta = transfer['meta']
+            self.slots[str(transfer['slotid'])] = {
+                'name': meta['name'], 'id': random.randint(0, 0xffff), 'project_id': meta['project_id'],
+                'modified': meta['modified'], 'created': meta['created'], 'size': len(transfer['data']),
+                'type': meta['type'],
+            }
+            self._send_storage_status()
+        return {'next_ptr': len(transfer['data'])}
+
+    def _rpc_move_project(self, params):
+        old = str(params['old_slotid'])
+        new = str(params['new_slotid'])
+        if old not in self.slots: raise ValueError('slot %s is empty' % old)
+        (self.slots[new], moved) = (self.slots.pop(old), self.slots.get(new))
+        if moved is not None:
+            self.slots[old] = moved
+        self._send_storage_status()
+        return None
+
+    def _rpc_remove_project(self, params):
+        self.slots.pop(str(params['slotid']), None)
+        self._send_storage_status()
+        return None
+
+    def _rpc_program_execute(self, params):
+        slot = str(params['slotid'])
+        if slot not in self.slots: raise ValueError('slot %s is empty' % slot)
+        project_id = self.slots[slot]['project_id']
+        self.send_line(json.dumps({'m': 12, 'p': [project_id, True]}), self.response_latency)
+        self.send_line(json.dumps({'m': 12, 'p': [project_id, False]}), self.response_latency + self.program_duration)
+        return None
+
+    def _rpc_program_terminate(self, params):
+        return None
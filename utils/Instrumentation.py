@@ -0,0 +1,74 @@
+import logging
+import threading
+from time import perf_counter_ns
+
+from utils.Histogram import Histogram
+
+
+logger = logging.getLogger(__name__)
+
+
+class Instrumentation(object):
+    """Named counters and timing histograms for the receive pipeline.
+
+    Timings are recorded in nanoseconds.  When enabled is False, recording is skipped
+    and fire() simply raises the event, so callers pay only an attribute check; count()
+    still counts, as it is only used for rare events outside the per-line path.
+    Recording is thread-safe: the reader, dispatch and reactor threads all record.
+    """
+
+    def __init__(self, enabled = False) -> None:
+        self.enabled = enabled
+        self._histograms = {}
+        self._counters = {}
+        self._subscriber_histograms = {}
+        self._lock = threading.Lock()
+
+    def histogram(self, name) -> Histogram:
+        h = self._histograms.get(name)
+        if h is None:
+            with self._lock:
+                h = self._histograms.setdefault(name, Histogram())
+        return h
+
+    def count(self, name, n = 1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + n
+
+    def record(self, name, start_ns):
+        """Record the time elapsed since start_ns (from time.perf_counter_ns) in the named histogram."""
+        self.histogram(name).record(perf_counter_ns() - start_ns)
+
+    def fire(self, name, event_slot, *args):
+        """Raise an event, timing each subscriber separately.
+
+        Subscriber timings are recorded in histograms named '<name>:<subscriber>'.
+        """
+        if not self.enabled:
+            event_slot(*args)
+            return
+        histograms = self._subscriber_histograms
+        for target in tuple(event_slot.targets):
+            start = perf_counter_ns()
+            target(*args)
+            elapsed = perf_counter_ns() - start
+            h = histograms.get((name, target))
+            if h is None:
+                h = self.histogram(name + ':' + getattr(target, '__qualname__', repr(target)))
+                histograms[(name, target)] = h
+            h.record(elapsed)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self._counters = {}
+            self._subscriber_histograms = {}
+
+    def snapshot(self):
+        """Counters and histogram summaries (ns) as a dict."""
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            'counters': counters,
+            'timings_ns': {name: h.snapshot() for (name, h) in list(self._histograms.items())},
+        }
@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+
+import appdirs
+
+
+def load_manifest(filename):
+    """Read a slot manifest: the programs that should be stored in each slot of the hub.
+
+    The manifest is YAML, mapping slot numbers to a program file, or to a dict with
+    keys file, and optionally name, compile and vm (see run_command.py cp):
+        slots:
+          0: programs/drive.py
+          1: {file: programs/arm.py, name: Arm, compile: true}
+    Relative file names are taken relative to the manifest.
+
+    Returns a dict: slot (int) -> dict with keys file, name, compile, vm.
+    """
+    import yaml
+    with open(filename) as f:
+        manifest = yaml.safe_load(f)
+    base = os.path.dirname(os.path.abspath(filename))
+    slots = {}
+    for (slot, entry) in (manifest['slots'] or {}).items():
+        if isinstance(entry, str):
+            entry = {'file': entry}
+        path = os.path.join(base, entry['file'])
+        slots[int(slot)] = {
+            'file': path,
+            'name': entry['name'] if 'name' in entry else os.path.basename(path),
+            'compile': bool(entry['compile']) if 'compile' in entry else False,
+            'vm': bool(entry['vm']) if 'vm' in entry else False,
+        }
+    return slots
+
+def content_hash(entry):
+    """Hash identifying what uploading a manifest entry would store: file content, name and options."""
+    h = hashlib.sha256()
+    with open(entry['file'], 'rb') as f:
+        h.update(f.read())
+    h.update(json.dumps([entry['name'], entry['compile'], entry['vm']]).encode('utf-8'))
+    return h.hexdigest()
+
+def plan_moves(wanted, stored, keep):
+    """Moves that bring already-stored programs to the slots where they are wanted.
+
+    wanted : dict slot -> content hash, for slots not yet holding the right program
+    stored : dict slot -> content hash (or None if unknown) of what the hub holds
+    keep : set of slots that already hold the right program and must not be disturbed
+    Assumes move_project swaps the two slots' contents, so one move may place two programs.
+    That is how the emulator behaves but is not known of the hub, so a caller should make
+    the first move only, and plan again from the storage status the hub then reports.
+    Returns (list of (from, to), set of wanted slots placed by the moves).
+    """
+    stored = dict(stored)
+    keep = set(keep)
+    moves = []
+    placed = set()
+    for (slot, digest) in sorted(wanted.items()):
+        if stored.get(slot) == digest: # swapped here by an earlier move
+            placed.add(slot)
+            keep.add(slot)
+            continue
+        sources = [s for (s, d) in stored.items() if d == digest and s not in keep and s != slot]
+        if not sources: continue
+        source = sources[0]
+        moves.append((source, slot))
+        (stored[slot], stored[source]) = (stored.get(source), stored.get(slot))
+        if stored[source] is None: del stored[source]
+        placed.add(slot)
+        keep.add(slot)
+    return (moves, placed)
+
+
+class SyncState(object):
+    """What this machine has uploaded: project_id -> content hash, size and modified time.
+
+    Project ids are generated at random on upload, so a project id found in a hub's
+    storage status identifies the upload, and hence the content, on any hub.
+    """
+
+    def __init__(self, filename = None) -> None:
+        self.filename = filename if filename is not None else os.path.join(appdirs.user_cache_dir('lego-hub-tk'), 'sync_state.json')
+        self.uploads = {}
+        if os.path.exists(self.filename):
+            with open(self.filename) as f:
+                self.uploads = json.load(f)
+
+    def content_of(self, slot_info):
+        """Content hash of a slot, from get_storage_status, or None if it is not a known upload."""
+        upload = self.uploads.get(slot_info.get('project_id'))
+        if upload is None: return None
+        if upload['size'] != slot_info.get('size') or upload['modified'] != slot_info.get('modified'): return None
+        return upload['hash']
+
+    def record(self, digest, slot_info):
+        """Remember that the program in a slot (from get_storage_status) was uploaded from content digest."""
+        self.uploads[slot_info['project_id']] = {'hash': digest, 'size': slot_info['size'], 'modified': slot_info['modified']}
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+        temp = self.filename + '.tmp'
+        with open(temp, 'w') as f:
+            json.dump(self.uploads, f, indent=1)
+        os.replace(temp, self.filename)